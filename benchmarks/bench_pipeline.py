@@ -0,0 +1,120 @@
+"""End-to-end benchmark of the translation pipeline against the offline backend
+
+Copies EARoot, js and the cache/glossary files into a temporary directory and
+runs the full main() flow there, so the working tree is never touched.
+
+Run from the repository root:
+
+    python benchmarks/bench_pipeline.py [--latency 0.2] [--throttle-rate 0.05] [--translate-all] [--providers 2]
+
+A provider that fails every request must not stall the run; its strings go to the failures file:
+
+    python benchmarks/bench_pipeline.py --translate-all --empty-cache --error-rate 1.0 --deadline 60
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+import translate  # noqa: E402
+
+
+def prepare_tree(destination, with_cache):
+    """Copy the export (and optionally the JSON cache) into destination"""
+    shutil.copytree(os.path.join(REPO_ROOT, 'EARoot'), os.path.join(destination, 'EARoot'))
+    shutil.copytree(os.path.join(REPO_ROOT, 'js'), os.path.join(destination, 'js'))
+    files = [translate.GLOSSARY_FILE] + ([translate.CACHE_FILE] if with_cache else [])
+    for name in files:
+        shutil.copy(os.path.join(REPO_ROOT, name), destination)
+
+
+def run_once(name, argv):
+    """Run main() once and print its throughput figures"""
+    start = time.perf_counter()
+    translate.main(argv)
+    elapsed = time.perf_counter() - start
+
+    strings = 0
+    if os.path.exists(translate.CATALOG_FILE):
+        with open(translate.CATALOG_FILE, 'r', encoding='utf-8') as f:
+            entries = json.load(f)['entries']
+        strings = sum(len(entry['occurrences']) for entry in entries.values())
+    # Hit ratio of the lookups deciding what goes to the backend
+    lookups = translate.metrics.phases.get('translate', {})
+    hits = sum(lookups.get(name, 0) for name in ('cache_hits', 'glossary_hits', 'fuzzy_hits'))
+    misses = lookups.get('cache_misses', 0)
+    totals = translate.metrics.totals()
+    # Files the run actually parsed, not the size of the export: extraction sees each once
+    processed = translate.metrics.phases.get('extract') or translate.metrics.phases.get('apply', {})
+    file_count = sum(processed.get(f"{kind}_files", 0) for kind in ('html', 'xml', 'menu'))
+    return {
+        'run': name,
+        'seconds': round(elapsed, 3),
+        'files': file_count,
+        'files_per_second': round(file_count / elapsed, 1),
+        'strings': strings,
+        'strings_per_second': round(strings / elapsed, 1),
+        'cache_hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None,
+        'api_calls': totals['api_calls'],
+        'retries': totals['retries'],
+        'failovers': totals['failovers'],
+        'failed_strings': totals['failed_strings'],
+        'backend_seconds': round(totals['network_seconds'], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the full translation pipeline offline")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per backend request")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests failing")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument('--rate', type=float, default=50.0, help="token bucket requests per second")
+    parser.add_argument('--retry-delay', type=float, default=0.5, help="first 429 backoff in seconds")
+    parser.add_argument('--providers', type=int, default=1,
+                        help="offline providers to fail over between; only the first gets the injected faults")
+    parser.add_argument('--hedge-after', type=float, help="hedge requests slower than this many seconds")
+    parser.add_argument('--empty-cache', action='store_true', help="start without translation_cache.json")
+    parser.add_argument('--translate-all', action='store_true',
+                        help="disable the already-English skip rule, as for an untranslated export")
+    parser.add_argument('--deadline', type=float, help="fail if a run takes longer than this many seconds")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    backends = [f"local:latency={args.latency},error_rate={args.error_rate},throttle_rate={args.throttle_rate}"]
+    backends += [f"local:latency={args.latency},seed={i}" for i in range(1, args.providers)]
+    options = ['--backend', *backends]
+    if args.hedge_after is not None:
+        options += ['--hedge-after', str(args.hedge_after)]
+    translate.rate_limiter = translate.TokenBucket(args.rate, translate.MAX_WORKERS)
+    translate.RETRY_DELAY = args.retry_delay
+    if args.translate_all:
+        translate.text_rules = translate.TextRules(english_ratio=1.0)
+
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='ea-bench-') as workdir:
+        prepare_tree(workdir, not args.empty_cache)
+        os.chdir(workdir)
+        try:
+            results.append(run_once('full', ['--force', *options]))
+            results.append(run_once('incremental', options))
+        finally:
+            os.chdir(cwd)
+
+    for result in results:
+        print(json.dumps(result))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    slow = [result['run'] for result in results if args.deadline and result['seconds'] > args.deadline]
+    if slow:
+        sys.exit(f"Runs over the {args.deadline} s deadline: {', '.join(slow)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Micro-benchmark of the skip filter and normalizer over the real cache strings
+
+Run from the repository root:
+
+    python benchmarks/bench_text_rules.py [--rounds N]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import translate  # noqa: E402
+
+
+def load_corpus(path):
+    """Get every source and translated string stored in the JSON cache"""
+    with open(path, 'r', encoding='utf-8') as f:
+        cache = json.load(f)
+    return list(cache) + list(cache.values())
+
+
+def measure(name, function, strings, rounds):
+    """Time function over the corpus and print the per-string cost"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function(strings)
+    elapsed = time.perf_counter() - start
+    count = len(strings) * rounds
+    print(f"{name:<28} {count / elapsed:>12,.0f} strings/s {elapsed / count * 1e6:>8.2f} us/string")
+
+
+def per_string(strings):
+    for text in strings:
+        if not translate.should_skip_translation(text):
+            translate.clean_html_text(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the text skip/normalize rules")
+    parser.add_argument('--rounds', type=int, default=20, help="passes over the corpus")
+    parser.add_argument('--corpus', default=translate.CACHE_FILE, help="JSON cache file to take strings from")
+    args = parser.parse_args()
+
+    strings = load_corpus(args.corpus)
+    print(f"{len(strings)} corpus strings, {len(set(strings))} unique, {args.rounds} rounds")
+
+    measure("per-string skip + clean", per_string, strings, args.rounds)
+    measure("batch classify (cold)", lambda batch: translate.TextRules().classify(batch), strings, args.rounds)
+    rules = translate.TextRules()
+    rules.classify(strings)
+    measure("batch classify (memoized)", rules.classify, strings, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
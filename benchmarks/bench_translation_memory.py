@@ -0,0 +1,81 @@
+"""Micro-benchmark of fuzzy TranslationMemory lookups
+
+Indexes the real cache strings and a synthetic small-vocabulary set (the worst case for
+trigram postings), then times lookups of near-duplicates (one character changed) and of
+unrelated strings, with the candidate cap and without it to show what the cap misses.
+
+Run from the repository root:
+
+    python benchmarks/bench_translation_memory.py [--entries 40000] [--queries 2000]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import translate  # noqa: E402
+
+
+def export_corpus(path):
+    """Get the (source, translation) pairs of the JSON cache"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return list(json.load(f).items())
+
+
+def synthetic_corpus(count, rng):
+    """Get count sentences over a 300-word vocabulary of 10 letters"""
+    vocabulary = [''.join(rng.choice('abcdefghij') for _ in range(rng.randint(3, 8))) for _ in range(300)]
+    sentences = set()
+    while len(sentences) < count:
+        sentences.add(' '.join(rng.choice(vocabulary) for _ in range(rng.randint(3, 10))))
+    # Translations keep the words verbatim so a changed word can be patched in
+    return [(sentence, f"en: {sentence}") for sentence in sorted(sentences)]
+
+
+def near_duplicates(entries, count, rng):
+    """Get sources with one letter replaced, which the memory should still match"""
+    queries = []
+    for source, _ in rng.sample(entries, min(count, len(entries))):
+        positions = [i for i, char in enumerate(source) if char.isalpha()]
+        if len(source) >= 12 and positions:
+            i = rng.choice(positions)
+            queries.append(source[:i] + ('x' if source[i] != 'x' else 'y') + source[i + 1:])
+    return queries
+
+
+def measure(name, memory, queries):
+    """Time lookups of queries and print the per-lookup cost and the matches found"""
+    start = time.perf_counter()
+    hits = sum(memory.lookup(query) is not None for query in queries)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40} {elapsed / len(queries) * 1e3:>7.3f} ms/lookup {hits:>6}/{len(queries)} matched")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fuzzy translation memory lookups")
+    parser.add_argument('--entries', type=int, default=40000, help="synthetic strings to index")
+    parser.add_argument('--queries', type=int, default=2000, help="lookups per measurement")
+    parser.add_argument('--corpus', default=translate.CACHE_FILE, help="JSON cache file to take strings from")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpora = [('export', export_corpus(args.corpus)), ('synthetic', synthetic_corpus(args.entries, rng))]
+    for name, entries in corpora:
+        unrelated = [source for source, _ in synthetic_corpus(args.queries, random.Random(args.seed + 1))]
+        similar = near_duplicates(entries, args.queries, rng)
+        for cap in (translate.FUZZY_CANDIDATES, None):
+            memory = translate.TranslationMemory(max_candidates=cap)
+            start = time.perf_counter()
+            memory.build(entries)
+            print(f"{name}: {len(entries)} entries indexed in {time.perf_counter() - start:.2f} s, "
+                  f"max_candidates={cap}")
+            measure(f"  {name} near-duplicates", memory, similar)
+            measure(f"  {name} unrelated", memory, unrelated)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,458 +1,2243 @@
 import os
+import abc
+import argparse
 import re
 import json
+import hashlib
+import html
+import functools
+import difflib
+import math
+import shutil
+import sqlite3
 from bs4 import BeautifulSoup
-import translators as ts
 import time
+import random
+import threading
+import logging
+from collections import Counter
+from itertools import chain, zip_longest
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
 from tqdm import tqdm
 
+try:
+    import lxml  # noqa: F401  Optional faster parser backend for BeautifulSoup
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
 # Translation cache
-CACHE_FILE = 'translation_cache.json'
-translation_cache = {}
+CACHE_FILE = 'translation_cache.json'  # Legacy JSON cache, migrated into the store on first run
+CACHE_BACKEND = 'sqlite'  # 'sqlite' or 'journal'
+CACHE_DB = 'translation_cache.db'
+CACHE_JOURNAL = 'translation_cache.jsonl'
+CATALOG_FILE = 'translation_catalog.json'
+MANIFEST_FILE = 'translation_manifest.json'
+RUN_JOURNAL = 'translation_run.jsonl'
+TOC_DIR = os.path.join('js', 'data')  # tocTab files, plus the GUID to page maps in guidmaps/
+GLOSSARY_FILE = 'glossary.json'
+glossaries = {}  # target language -> Glossary
+FUZZY_THRESHOLD = 0.85  # Trigram Jaccard similarity needed to reuse a cached translation
+fuzzy_threshold = FUZZY_THRESHOLD
+FUZZY_CANDIDATES = 50  # Most strings a fuzzy lookup compares, those sharing the most indexed trigrams first
+translation_memories = {}  # target language -> TranslationMemory
+SOURCE_LANG = 'nl'
+TARGET_LANG = 'en'  # Other targets get their own cache and glossary files, e.g. translation_cache.nl-de.db
+HTML_PARSER = 'stream'  # Byte-preserving rewriter; 'html.parser' or 'lxml' round-trip through BeautifulSoup
+PARSE_WORKERS = os.cpu_count() or 1  # Processes for the extract and apply stages
+APPLY_CHUNK_FILES = 100  # Files a full run translates and then writes together, in TOC order
+RULES_VERSION = 1  # Bump whenever clean_html_text/should_skip_translation change; cached entries are re-keyed offline
+translation_cache = {}  # nl -> en
+translation_caches = {}  # other target language -> TranslationCache
+cache_backend = CACHE_BACKEND
+cache_lock = threading.RLock()
+
+# Batch translation settings
+MAX_WORKERS = 4  # Concurrent requests per provider to start with
+MAX_CONCURRENCY = 16  # Ceiling of the adaptive per-provider concurrency limit
+LATENCY_TOLERANCE = 3.0  # Responses slower than this multiple of the fastest one count as congestion
+BREAKER_FAILURES = 5  # Consecutive failures that open a provider's circuit
+BREAKER_RESET = 60  # Seconds before an open circuit lets a probe request through
+MAX_COOLDOWN = 300  # Cap in seconds of the doubling 429 cool-down of a provider
+HEDGE_AFTER = None  # Seconds after which a slow request is also sent to another provider (None: no hedging)
+hedge_after = HEDGE_AFTER
+FAILURES_FILE = 'translation_failures.json'  # Strings that could not be translated, retried by the next run
+BATCH_SIZE = 20  # Maximum segments packed into one request
+BATCH_MAX_CHARS = 4000  # Maximum characters per packed request
+SEGMENT_MIN_CHARS = 80  # Longer texts are translated and cached per sentence
+REQUESTS_PER_SECOND = 0.5  # Sustained provider request rate
+RETRY_DELAY = 10  # First backoff in seconds, doubled on every 429
+MAX_RETRIES = 3
+BATCH_SEPARATOR = '\n'  # Cleaned texts never contain newlines
+DEFAULT_BACKEND = 'bing'  # Any translators provider name, or 'local' for the offline stand-in
+
+# Output trees per target language share these untranslated parts of the export through links
+SHARED_EXPORT_FILES = ('index.htm', 'toc.htm', 'blank.htm', 'css', 'images', 'linkdocs',
+                       os.path.join('js', 'displayToc.js'), os.path.join(TOC_DIR, 'guidmaps'))
+
+METRICS_FILE = 'translation_metrics.json'
+METRIC_PREFIX = 'ea_translate_'
+
+logger = logging.getLogger('translate')
+
+class Metrics:
+    """Per-phase wall time and counters of a run, exported as JSON or Prometheus text"""
+
+    def __init__(self):
+        self.phases = {}  # phase -> Counter of seconds and counts
+        self.current = 'setup'
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Attribute the wall time and counters of a block to a phase"""
+        previous, self.current = self.current, name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add('wall_seconds', time.perf_counter() - started, name)
+            self.current = previous
+            logger.info(f"Phase {name}: " + ', '.join(
+                f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                for key, value in sorted(self.phases[name].items())))
+
+    def add(self, name, amount=1, phase=None):
+        """Add to a counter of the current (or given) phase from any thread"""
+        with self.lock:
+            self.phases.setdefault(phase or self.current, Counter())[name] += amount
+
+    def totals(self):
+        """Get every counter summed over all phases"""
+        with self.lock:
+            total = Counter()
+            for counters in self.phases.values():
+                total.update(counters)
+            return total
+
+    def report(self):
+        return {
+            'phases': {phase: dict(counters) for phase, counters in self.phases.items()},
+            'totals': dict(self.totals()),
+        }
+
+    def write_json(self, path=METRICS_FILE):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def write_prometheus(self, path):
+        """Write the counters in the Prometheus text exposition format"""
+        samples = {}
+        for phase, counters in self.phases.items():
+            for name, value in counters.items():
+                samples.setdefault(name, []).append((phase, value))
+        lines = []
+        for name in sorted(samples):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} gauge")
+            lines.extend(f'{METRIC_PREFIX}{name}{{phase="{phase}"}} {value}' for phase, value in samples[name])
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+metrics = Metrics()
+
+def file_kind(file_path):
+    """Get the metrics group of a file: menu, xml or html"""
+    if file_path.endswith(".xml"):
+        return "menu" if os.path.basename(file_path) == 'root.xml' else "xml"
+    return "html"
+
+def add_file_timings(file_path, timings):
+    """Add a worker's timings to the current phase, in total and per file kind"""
+    kind = file_kind(file_path)
+    metrics.add(f"{kind}_files")
+    for name, value in timings.items():
+        metrics.add(name, value)
+        metrics.add(f"{kind}_{name}", value)
+
+def progress(iterable, **kwargs):
+    """Show a progress bar on interactive terminals only"""
+    return tqdm(iterable, disable=None, **kwargs)
+
+class SqliteCacheStore:
+    """Translation cache store in an SQLite database in WAL mode"""
+
+    def __init__(self, path=CACHE_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        # Autocommit: every write is its own small, crash-safe transaction
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM translations WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO translations (key, value) VALUES (?, ?)', (key, value))
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute('DELETE FROM translations WHERE key = ?', (key,))
+
+    @contextmanager
+    def transaction(self):
+        """Run a block in one transaction, rolled back if it raises so the autocommit connection stays usable"""
+        self.conn.execute('BEGIN')
+        try:
+            yield
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def update(self, items):
+        """Write many entries in a single transaction"""
+        with self.lock, self.transaction():
+            self.conn.executemany('INSERT OR REPLACE INTO translations (key, value) VALUES (?, ?)', items)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM translations')
+
+    def replace(self, items):
+        """Swap the whole cache contents in a single transaction"""
+        with self.lock, self.transaction():
+            self.conn.execute('DELETE FROM translations')
+            self.conn.executemany('INSERT OR REPLACE INTO translations (key, value) VALUES (?, ?)', items)
+
+    def keys(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute('SELECT key FROM translations')]
+
+    def items(self):
+        with self.lock:
+            return self.conn.execute('SELECT key, value FROM translations').fetchall()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM translations').fetchone()[0]
+
+    def flush(self):
+        """Fold the write-ahead log back into the database file"""
+        with self.lock:
+            self.conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+class JournalCacheStore:
+    """Translation cache store as an append-only JSON lines journal with periodic compaction"""
+
+    def __init__(self, path=CACHE_JOURNAL, compact_ratio=2.0, compact_min=1000):
+        self.path = path
+        self.compact_ratio = compact_ratio  # Compact once the journal holds this many records per live entry
+        self.compact_min = compact_min
+        self.lock = threading.Lock()
+        self.offsets = {}  # key -> byte offset of its latest record; values are read on demand
+        self.records = 0
+        self.file = open(path, 'a+b')
+        self.scan()
+
+    def scan(self):
+        """Index the journal, dropping a record left incomplete by a crash"""
+        self.offsets = {}
+        self.records = 0
+        self.file.seek(0)
+        offset = 0
+        for line in iter(self.file.readline, b''):
+            try:
+                # A record is only complete with its newline; the next append would join a torn one
+                if not line.endswith(b'\n'):
+                    raise ValueError("torn record")
+                record = json.loads(line)
+            except ValueError:
+                self.file.truncate(offset)
+                break
+            if len(record) == 1:  # Deletion marker
+                self.offsets.pop(record[0], None)
+            else:
+                self.offsets[record[0]] = offset
+            self.records += 1
+            offset += len(line)
+
+    def append(self, record):
+        self.file.seek(0, os.SEEK_END)
+        offset = self.file.tell()
+        self.file.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+        self.file.flush()
+        self.records += 1
+        return offset
+
+    def get(self, key):
+        with self.lock:
+            offset = self.offsets.get(key)
+            if offset is None:
+                return None
+            self.file.seek(offset)
+            return json.loads(self.file.readline())[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.offsets[key] = self.append([key, value])
+            if self.records > self.compact_min and self.records > self.compact_ratio * len(self.offsets):
+                self.compact()
+
+    def delete(self, key):
+        with self.lock:
+            if self.offsets.pop(key, None) is not None:
+                self.append([key])
+
+    def update(self, items):
+        for key, value in items:
+            self.set(key, value)
+
+    def clear(self):
+        with self.lock:
+            self.offsets = {}
+            self.compact()
 
-def load_cache():
-    """Load translation cache from file"""
-    global translation_cache
+    def replace(self, items):
+        """Swap the whole cache contents by writing a new journal and renaming it into place"""
+        with self.lock:
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                for key, value in items:
+                    f.write(json.dumps([key, value], ensure_ascii=False).encode('utf-8') + b'\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.file.close()
+            os.replace(temp_path, self.path)
+            self.file = open(self.path, 'a+b')
+            self.scan()
+
+    def keys(self):
+        with self.lock:
+            return list(self.offsets)
+
+    def items(self):
+        return [(key, self.get(key)) for key in self.keys()]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def compact(self):
+        """Rewrite the journal with only the live entries (caller holds the lock)"""
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            for key, offset in self.offsets.items():
+                self.file.seek(offset)
+                f.write(self.file.readline())
+            f.flush()
+            os.fsync(f.fileno())
+        self.file.close()
+        os.replace(temp_path, self.path)
+        self.file = open(self.path, 'a+b')
+        self.scan()
+
+    def flush(self):
+        with self.lock:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+CACHE_BACKENDS = {'sqlite': SqliteCacheStore, 'journal': JournalCacheStore}
+CACHE_PATHS = {'sqlite': CACHE_DB, 'journal': CACHE_JOURNAL}
+
+def language_file(path, to_lang):
+    """Get the per-language-pair variant of a cache or glossary file name"""
+    if to_lang == TARGET_LANG:
+        return path
+    base, extension = os.path.splitext(path)
+    return f"{base}.{SOURCE_LANG}-{to_lang}{extension}"
+
+class TranslationCache(MutableMapping):
+    """Dict-like view of the translation cache on top of a cache store"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, key):
+        value = self.store.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.store.set(key, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.store.delete(key)
+
+    def __contains__(self, key):
+        return self.store.get(key) is not None
+
+    def __iter__(self):
+        return iter(self.store.keys())
+
+    def __len__(self):
+        return len(self.store)
+
+    def items(self):
+        return self.store.items()
+
+    def update(self, entries):
+        self.store.update(dict(entries).items())
+
+    def replace(self, entries):
+        self.store.replace(dict(entries).items())
+
+    def clear(self):
+        self.store.clear()
+
+def load_cache(backend=CACHE_BACKEND):
+    """Open the translation cache store, migrating the JSON cache file on first use"""
+    global translation_cache, cache_backend
+    cache_backend = backend
+    translation_caches.clear()
+    translation_memories.clear()
     try:
-        if os.path.exists(CACHE_FILE):
+        translation_cache = TranslationCache(CACHE_BACKENDS[backend]())
+        if not len(translation_cache) and os.path.exists(CACHE_FILE):
             with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                translation_cache = json.load(f)
-            print(f"Loaded {len(translation_cache)} cached translations")
+                legacy_cache = json.load(f)
+            # Older versions could cache None for a text that failed to clean
+            entries = [(key, value) for key, value in legacy_cache.items() if value is not None]
+            translation_cache.store.update(entries)
+            logger.info(f"Migrated {len(entries)} translations from {CACHE_FILE}")
+        logger.info(f"Loaded {len(translation_cache)} cached translations")
     except Exception as e:
-        print(f"Error loading cache: {e}")
+        logger.error(f"Error loading cache: {e}")
+
+def get_cache(to_lang=TARGET_LANG):
+    """Get the translation cache of the nl -> to_lang pair, opening its store on first use"""
+    if to_lang == TARGET_LANG:
+        return translation_cache
+    with cache_lock:
+        if to_lang not in translation_caches:
+            path = language_file(CACHE_PATHS[cache_backend], to_lang)
+            translation_caches[to_lang] = TranslationCache(CACHE_BACKENDS[cache_backend](path))
+            logger.info(f"Loaded {len(translation_caches[to_lang])} cached {SOURCE_LANG}-{to_lang} translations")
+        return translation_caches[to_lang]
 
 def save_cache():
-    """Save translation cache to file"""
+    """Flush the translation cache stores to disk"""
     try:
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(translation_cache, f, ensure_ascii=False, indent=2)
-        print(f"Saved {len(translation_cache)} translations to cache")
+        if isinstance(translation_cache, TranslationCache):
+            translation_cache.store.flush()
+        logger.info(f"Saved {len(translation_cache)} translations to cache")
+        for to_lang, cache in translation_caches.items():
+            cache.store.flush()
+            logger.info(f"Saved {len(cache)} {SOURCE_LANG}-{to_lang} translations to cache")
     except Exception as e:
-        print(f"Error saving cache: {e}")
-
-def get_dutch_translations():
-    """Get dictionary of Dutch to English translations"""
-    translations = {
-        # Menu items and titles
-        "Inleiding": "Introduction",
-        "Model": "Model",
-        "Overzicht rechtsvormen": "Overview of Legal Forms",
-        "HR Model Overzicht (conceptueel)": "Trade Register Model Overview (conceptual)",
-        "HR Model Overzicht (volledig)": "Trade Register Model Overview (complete)",
-        "HR Model Objecttypen": "Trade Register Model Object Types",
-        "HR Model Gegevensgroepen": "Trade Register Model Data Groups",
-        "HR Model Domeinwaarden": "Trade Register Model Domain Values",
-        "Referenties": "References",
-        "Inhoud van het handelsregister": "Contents of the Trade Register",
-        "inhoud van het handelsregister": "Contents of the Trade Register",
-        "Content of the trade register": "Contents of the Trade Register",
-        "Content of the Trade Register": "Contents of the Trade Register",
-        "Identificerende gegevens": "Identifying Data",
-        "Handelsregister": "Trade Register",
-        "Beschrijving": "Description",
-        "Toelichting": "Explanation",
-        "Gegevensgroep": "Data Group",
-        "Wetgeving": "Legislation",
-        "Documentatie": "Documentation",
-        "Kamer van Koophandel": "Chamber of Commerce",
-        "Basisregistraties": "Basic Registrations",
-        "Openbare gegevens": "Public Data",
-        "Niet-openbare gegevens": "Non-public Data",
-        "Advocaten": "Lawyers",
-        "Notarissen": "Notaries",
-        "Deurwaarders": "Bailiffs",
-        "Beschermde adressen": "Protected Addresses",
-        "Handelsregister Dataservice": "Trade Register Data Service",
-        "Databankrechten": "Database Rights",
-        "Openbaar": "Public",
-        "Niet-openbaar": "Non-public",
-        "Autorisatieniveaus": "Authorization Levels",
-        "Markt": "Market",
-        "Datacatalogus": "Data Catalog",
-        "Datacatalogus 3.0.4h": "Data Catalog 3.0.4h",
-        "Data catalog 3. 0. 4h": "Data Catalog 3.0.4h",
-        "Data Catalog 3. 0. 4h": "Data Catalog 3.0.4h",
-        "Data catalog": "Data Catalog",
-        "Overzicht": "Overview",
-        "Rechtsvormen": "Legal Forms",
-        "Objecttypen": "Object Types",
-        "Gegevensgroepen": "Data Groups",
-        "Domeinwaarden": "Domain Values",
-        "Buitenlandse onderneming": "Foreign Company",
-        "Eenmanszaak": "Sole Proprietorship",
-        "Rechtspersoon": "Legal Entity",
-        "Samenwerkingsverband": "Partnership",
-        "Vestiging": "Establishment",
-        "Functionaris": "Official",
-        "Gemachtigde": "Authorized Representative",
-        "Aansprakelijke": "Liable Party",
-        "Eigenaar": "Owner",
-        "Bestuurder": "Director",
-        "Commissaris": "Commissioner",
+        logger.error(f"Error saving cache: {e}")
+
+# Words and punctuation marks; spaces and hyphens inside words only separate tokens
+GLOSSARY_TOKEN = re.compile(r'\w+|(?<!\w)-|-(?!\w)|[^\w\s-]')
+
+class Glossary:
+    """Dutch to English terms with a case/whitespace/hyphen-folded token trie"""
+
+    def __init__(self, translations):
+        self.trie = {}
+        for source, target in translations.items():
+            node = self.trie
+            for token in self.fold(source):
+                node = node.setdefault(token, {})
+            node.setdefault(None, target)  # First entry wins for variants that fold together
+
+    @staticmethod
+    def tokenize(text):
+        return list(GLOSSARY_TOKEN.finditer(text))
+
+    @classmethod
+    def fold(cls, text):
+        return [match.group().lower() for match in cls.tokenize(text)]
+
+    def match(self, tokens, start):
+        """Get (end, translation) of the longest term starting at tokens[start], or None"""
+        node, found = self.trie, None
+        for end in range(start, len(tokens)):
+            node = node.get(tokens[end].group().lower())
+            if node is None:
+                break
+            if None in node:
+                found = (end + 1, node[None])
+        return found
+
+    def replace(self, text):
+        """Replace known terms inside text; return the result and whether every word was covered"""
+        tokens = self.tokenize(text)
+        parts, copied, covered, i = [], 0, True, 0
+        while i < len(tokens):
+            found = self.match(tokens, i)
+            if found is None:
+                if tokens[i].group()[0].isalpha():
+                    covered = False
+                i += 1
+                continue
+            end, target = found
+            parts.append(text[copied:tokens[i].start()])
+            parts.append(target)
+            copied = tokens[end - 1].end()
+            i = end
+        parts.append(text[copied:])
+        return ''.join(parts), covered and bool(tokens)
+
+def load_glossary(path=GLOSSARY_FILE):
+    """Load a glossary (Dutch to English by default) from its JSON file"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            translations = json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading glossary: {e}")
+        translations = {}
+    return Glossary(translations)
+
+def get_glossary(to_lang=TARGET_LANG):
+    """Get the glossary of a target language, building it on first use; empty without a glossary file"""
+    if to_lang not in glossaries:
+        path = language_file(GLOSSARY_FILE, to_lang)
+        glossaries[to_lang] = load_glossary(path) if to_lang == TARGET_LANG or os.path.exists(path) else Glossary({})
+    return glossaries[to_lang]
+
+class TranslationMemory:
+    """Fuzzy index over the cached translations to reuse them for near-identical strings
+
+    Strings that only differ in case, spacing, hyphens or punctuation share a folded key.
+    Other candidates must reach the Jaccard threshold on character trigrams; they are found
+    with prefix filtering (only the rarest trigrams of each string are indexed, which is
+    enough for any pair above the threshold to share one). Postings are split by trigram
+    count so only strings of a size that can reach the threshold are looked at, and just the
+    max_candidates sharing the most prefix trigrams are compared; this keeps a lookup under
+    a millisecond on 40k similar strings (benchmarks/bench_translation_memory.py) at the
+    cost of an occasional missed match. Differing words are patched into the stored
+    translation when they appear in it verbatim (numbers, codes, names), otherwise the
+    next best match is tried.
+    """
+
+    NON_WORD = re.compile(r'[\W_]+')
+    WORD = re.compile(r'\w+')
+    DIGIT = re.compile(r'\d')
+
+    def __init__(self, threshold=FUZZY_THRESHOLD, min_length=8, max_candidates=FUZZY_CANDIDATES):
+        self.threshold = threshold
+        self.min_length = min_length  # Trigram similarity is meaningless for very short strings
+        self.max_candidates = max_candidates  # None compares every candidate
+        self.folded = {}  # folded text -> (source, translation)
+        self.trigrams = {}  # folded text -> set of trigrams
+        self.frequency = Counter()  # trigram -> number of indexed strings; fixes the prefix order
+        self.postings = {}  # trigram -> trigram count -> folded texts having it in their prefix
+
+    @classmethod
+    def fold(cls, text):
+        return cls.NON_WORD.sub(' ', text.lower()).strip()
+
+    @classmethod
+    def shingle(cls, folded):
+        # Digits are merged so strings differing only in numbers or codes still match
+        padded = f" {cls.DIGIT.sub('0', folded)} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def prefix(self, trigrams):
+        """Get the rarest trigrams; two sets above the threshold always share one of them"""
+        ordered = sorted(trigrams, key=lambda trigram: (self.frequency[trigram], trigram))
+        return ordered[:len(ordered) - math.ceil(self.threshold * len(ordered)) + 1]
+
+    def build(self, entries):
+        """Index many (source, translation) pairs, ordering trigrams by their frequency"""
+        added = [folded for folded in (self.store(source, translation) for source, translation in entries) if folded]
+        for folded in added:
+            self.frequency.update(self.trigrams[folded])
+        for folded in added:
+            self.index(folded)
+
+    def add(self, source, translation):
+        """Index one cached source text and its translation"""
+        folded = self.store(source, translation)
+        if folded:
+            self.index(folded)
+
+    def store(self, source, translation):
+        folded = self.fold(source)
+        if not folded or folded in self.folded:
+            return None
+        self.folded[folded] = (source, translation)
+        if len(folded) < self.min_length:
+            return None
+        self.trigrams[folded] = self.shingle(folded)
+        return folded
+
+    def index(self, folded):
+        if self.threshold <= 1:
+            trigrams = self.trigrams[folded]
+            for trigram in self.prefix(trigrams):
+                self.postings.setdefault(trigram, {}).setdefault(len(trigrams), []).append(folded)
+
+    def candidates(self, trigrams, sizes):
+        """Get the max_candidates folded texts sharing the most prefix trigrams with a string"""
+        shared = Counter()
+        for trigram in self.prefix(trigrams):
+            by_size = self.postings.get(trigram)
+            if by_size:
+                for size in sizes:
+                    shared.update(by_size.get(size, ()))
+        return [candidate for candidate, _ in shared.most_common(self.max_candidates)]
+
+    def lookup(self, text):
+        """Get a reusable translation for text, or None"""
+        folded = self.fold(text)
+        if folded in self.folded:
+            return self.folded[folded][1]
+        if len(folded) < self.min_length or self.threshold > 1:
+            return None
+        
+        trigrams = self.shingle(folded)
+        # Only sizes within the threshold can reach it
+        sizes = range(math.ceil(self.threshold * len(trigrams)), math.floor(len(trigrams) / self.threshold) + 1)
+        matches = []
+        for candidate in self.candidates(trigrams, sizes):
+            other = self.trigrams[candidate]
+            shared = len(trigrams & other)
+            score = shared / (len(trigrams) + len(other) - shared)
+            if score >= self.threshold:
+                matches.append((score, candidate))
+        # The best match whose differing words can be patched in, so adding entries never loses a match
+        for _, candidate in sorted(matches, reverse=True):
+            source, translation = self.folded[candidate]
+            patched = self.patch(source, translation, text)
+            if patched is not None:
+                return patched
+        return None
+
+    def patch(self, source, translation, text):
+        """Carry the words that differ between source and text over into translation"""
+        source_words = self.WORD.findall(source)
+        text_words = self.WORD.findall(text)
+        matcher = difflib.SequenceMatcher(None, [w.lower() for w in source_words], [w.lower() for w in text_words],
+                                          autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                continue
+            if tag != 'replace':
+                return None  # Added or removed words cannot be placed in the translation
+            old = r'\s+'.join(re.escape(word) for word in source_words[i1:i2])
+            translation, found = re.subn(rf'(?<!\w){old}(?!\w)', ' '.join(text_words[j1:j2]), translation, count=1)
+            if not found:
+                return None
+        return translation
+
+def get_translation_memory(to_lang=TARGET_LANG):
+    """Get the translation memory of a target language, indexing its cache on first use"""
+    with cache_lock:
+        if to_lang not in translation_memories:
+            memory = TranslationMemory(fuzzy_threshold)
+            # Identity entries of untranslatable strings are left out
+            memory.build((source, translated) for source, translated in get_cache(to_lang).items()
+                         if translated.strip().lower() != source)
+            translation_memories[to_lang] = memory
+        return translation_memories[to_lang]
+
+class TextRules:
+    """Precompiled skip filter and normalizer applied to every extracted text"""
+
+    WHITESPACE = re.compile(r'\s+')
+    SENTENCE_END = re.compile(r'([.!?]+)')
+    # Segment boundaries: after the end of a sentence or a run of line break tags
+    SEGMENT_BREAK = re.compile(r'((?<=[.!?])\s+|(?<=<br/>)\s*(?!\s|<br/>|$))')
+    # Segments without words, like a lone <br/>, are kept as they are
+    MARKUP_ONLY = re.compile(r'(?:<[^>]*>|[\W_])*$')
+    SPACE_BEFORE_PUNCTUATION = re.compile(r'\s+([.,;:!?])')
+    MISSING_SPACE_AFTER_PUNCTUATION = re.compile(r'([.,;:!?])([^\s])')
+    SPACE_BEFORE_CLOSE = re.compile(r'\s+\)')
+    SPACE_AFTER_OPEN = re.compile(r'\(\s+')
+    PHRASE_FIXES = (
+        ('sacrifices this data', 'provides this data'),
+        ('leg implemented', 'been implemented'),
+    )
+
+    # Words containing a Dutch accented character; other words count as English
+    ACCENTED_WORD = re.compile(r'\S*[éëïöüàèìòùâêîôûä]\S*', re.IGNORECASE)
+    # Dates and GUIDs at the start of the text
+    DATE_OR_GUID = re.compile(r'\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}|\d{2,4}[-/.]\d{1,2}[-/.]\d{1,2}'
+                              r'|\{?[0-9a-f]{8}-?(?:[0-9a-f]{4}-?){3}[0-9a-f]{12}\}?', re.IGNORECASE)
+    # Technical identifiers made of hex digits and dashes
+    HEX_IDENTIFIER = re.compile(r'\{?[0-9a-f-]+\}?$', re.IGNORECASE)
+    # Numbers and codes with optional quotes (matched against the stripped text)
+    NUMBER_OR_CODE = re.compile(r'(?:code:?\s*)?[\'"]?\d+[\'"]?$', re.IGNORECASE)
+
+    def __init__(self, english_ratio=0.5, memo_size=65536):
+        self.english_ratio = english_ratio  # Skip texts with a larger share of words without Dutch accents
+        # The same labels recur on most pages, so decisions are memoized
+        self.decide = functools.lru_cache(maxsize=memo_size)(self._decide)
+
+    def clean(self, text):
+        """Clean and normalize HTML text content"""
+        if not text or not isinstance(text, str):
+            return text
         
-        # Model overview variations
-        "HR-Model Overzicht (conceptueel)": "Trade Register Model Overview (conceptual)",
-        "HR Model Overzicht (conceptueel)": "Trade Register Model Overview (conceptual)",
-        "HR-Model Overzicht(conceptueel)": "Trade Register Model Overview (conceptual)",
-        "HR Model Overzicht(conceptueel)": "Trade Register Model Overview (conceptual)",
-        "HR-Model Overzicht - conceptueel": "Trade Register Model Overview - conceptual",
-        "HR Model Overzicht - conceptueel": "Trade Register Model Overview - conceptual",
-        "HR-Model Overzicht conceptueel": "Trade Register Model Overview (conceptual)",
-        "HR Model Overzicht conceptueel": "Trade Register Model Overview (conceptual)",
-        "HR-Model Overview (conceptueel)": "Trade Register Model Overview (conceptual)",
-        "HR Model Overview (conceptueel)": "Trade Register Model Overview (conceptual)",
-        "HR-Model Overview(conceptueel)": "Trade Register Model Overview (conceptual)",
-        "HR Model Overview(conceptueel)": "Trade Register Model Overview (conceptual)",
-        "HR-Model Overview - conceptueel": "Trade Register Model Overview - conceptual",
-        "HR Model Overview - conceptueel": "Trade Register Model Overview - conceptual",
-        "HR-Model Overview conceptueel": "Trade Register Model Overview (conceptual)",
-        "HR Model Overview conceptueel": "Trade Register Model Overview (conceptual)",
-        "HR Model Overview (conceptual)": "Trade Register Model Overview (conceptual)",
-        "HR-Model Overview (conceptual)": "Trade Register Model Overview (conceptual)",
-        "HR Model Overzicht (volledig)": "Trade Register Model Overview (complete)",
-        "HR-Model Overzicht (volledig)": "Trade Register Model Overview (complete)",
-        "HR Model Overview (volledig)": "Trade Register Model Overview (complete)",
-        "HR-Model Overview (volledig)": "Trade Register Model Overview (complete)",
-        "HR Model Overview (full)": "Trade Register Model Overview (complete)",
-        "HR-Model Overview (full)": "Trade Register Model Overview (complete)",
-        "Hr model overview (conceptual)": "Trade Register Model Overview (conceptual)",
-        "hr model overview (conceptual)": "Trade Register Model Overview (conceptual)",
-        "hr-model overview (conceptual)": "Trade Register Model Overview (conceptual)",
-        "hr-model overview (conceptueel)": "Trade Register Model Overview (conceptual)",
-        "hr model overzicht (conceptueel)": "Trade Register Model Overview (conceptual)",
-        "hr-model overzicht (conceptueel)": "Trade Register Model Overview (conceptual)",
-        "hr model overview (conceptueel)": "Trade Register Model Overview (conceptual)",
-        "hr-model overview (conceptueel)": "Trade Register Model Overview (conceptual)",
-        "hr model overzicht (conceptual)": "Trade Register Model Overview (conceptual)",
-        "hr-model overzicht (conceptual)": "Trade Register Model Overview (conceptual)",
-        "hr model overview (conceptual): class diagram": "Trade Register Model Overview (conceptual): class diagram",
-        "hr-model overview (conceptual): class diagram": "Trade Register Model Overview (conceptual): class diagram",
-        "hr model overzicht (conceptueel): class diagram": "Trade Register Model Overview (conceptual): class diagram",
-        "hr-model overzicht (conceptueel): class diagram": "Trade Register Model Overview (conceptual): class diagram",
-        "HR model overview (conceptual): class diagram": "Trade Register Model Overview (conceptual): class diagram",
-        "HR-model overview (conceptual): class diagram": "Trade Register Model Overview (conceptual): class diagram",
-        "HR model overzicht (conceptueel): class diagram": "Trade Register Model Overview (conceptual): class diagram",
-        "HR-model overzicht (conceptueel): class diagram": "Trade Register Model Overview (conceptual): class diagram",
+        # Remove multiple spaces
+        text = self.WHITESPACE.sub(' ', text)
         
-        # Common words and phrases
-        "producten bestellen": "order products",
-        "gegevenscatalogus": "data catalog",
-        "bevoegde gebruikers": "authorized users",
-        "niet-bevoegde gebruikers": "unauthorized users",
-        "onder constructie": "under construction",
-        "in bewerking": "in progress",
-        "raadplegen": "consult",
-        "opvragen": "request",
-        "inzien": "view",
-        "uittreksels": "extracts",
-        "producten": "products",
-        "diensten": "services",
+        # Fix sentence capitalization
+        sentences = self.SENTENCE_END.split(text)
+        for i in range(0, len(sentences), 2):
+            if sentences[i].strip():
+                sentences[i] = sentences[i].strip().capitalize()
+        text = ''.join(sentences)
         
-        # Special characters and formatting
-        "«": "«",
-        "»": "»",
-        "<br/>": "<br/>",
-    }
-    return translations
+        # Fix common formatting issues
+        text = self.SPACE_BEFORE_PUNCTUATION.sub(r'\1', text)
+        text = self.MISSING_SPACE_AFTER_PUNCTUATION.sub(r'\1 \2', text)
+        text = self.SPACE_BEFORE_CLOSE.sub(')', text)
+        text = self.SPACE_AFTER_OPEN.sub('(', text)
+        
+        # Fix specific phrases
+        for wrong, right in self.PHRASE_FIXES:
+            text = text.replace(wrong, right)
+        
+        return text.strip()
+
+    def segments(self, text, min_chars=SEGMENT_MIN_CHARS):
+        """Split a long cleaned text into its sentences, alternating with the whitespace between them"""
+        if len(text) < min_chars:
+            return [text]
+        return self.SEGMENT_BREAK.split(text)
+
+    def skip(self, text):
+        """Check if text should be skipped from translation"""
+        # Skip empty strings
+        stripped = text.strip() if text else ''
+        if not stripped:
+            return True
+        
+        # Skip if already in English (more than 50% of words are English)
+        words = len(text.split())
+        if (words - len(self.ACCENTED_WORD.findall(text))) / words > self.english_ratio:
+            return True
+        
+        # Skip dates, GUIDs, technical identifiers, numbers and codes
+        if self.DATE_OR_GUID.match(text) or self.HEX_IDENTIFIER.match(text) or self.NUMBER_OR_CODE.match(stripped):
+            return True
+        if '<br/>' in text and len(text.replace('<br/>', '').strip()) < 3:
+            return True
+        # Skip single words that are likely technical identifiers
+        if words == 1 and (text.isupper() or text.islower()) and len(text) <= 4:
+            return True
+        
+        return False
+
+    def _decide(self, text):
+        return None if self.skip(text) else self.clean(text)
+
+    def classify(self, texts):
+        """Get the cleaned text for each input, or None where it should be skipped"""
+        decide = self.decide
+        return [decide(text) for text in texts]
+
+text_rules = TextRules()
 
 def clean_html_text(text):
     """Clean and normalize HTML text content"""
-    if not text or not isinstance(text, str):
-        return text
-    
-    # Remove multiple spaces
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Fix sentence capitalization
-    sentences = re.split(r'([.!?]+)', text)
-    for i in range(0, len(sentences), 2):
-        if sentences[i].strip():
-            sentences[i] = sentences[i].strip().capitalize()
-    text = ''.join(sentences)
-    
-    # Fix common formatting issues
-    text = re.sub(r'\s+([.,;:!?])', r'\1', text)  # Remove space before punctuation
-    text = re.sub(r'([.,;:!?])([^\s])', r'\1 \2', text)  # Add space after punctuation
-    text = re.sub(r'\s+\)', ')', text)  # Fix closing parenthesis
-    text = re.sub(r'\(\s+', '(', text)  # Fix opening parenthesis
-    
-    # Fix specific phrases
-    text = text.replace('sacrifices this data', 'provides this data')
-    text = text.replace('leg implemented', 'been implemented')
-    
-    return text.strip()
+    return text_rules.clean(text)
 
 def should_skip_translation(text):
     """Check if text should be skipped from translation"""
-    # Skip empty strings
-    if not text or not text.strip():
-        return True
-        
-    # Skip if already in English (more than 50% of words are English)
-    words = text.lower().split()
-    if words:
-        english_words = sum(1 for word in words if not any(c in word for c in 'éëïöüàèìòùâêîôûäëïöü'))
-        if english_words / len(words) > 0.5:
-            return True
-    
-    # Skip dates (matches common date formats)
-    if re.match(r'^\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}', text):
-        return True
-    if re.match(r'^\d{2,4}[-/.]\d{1,2}[-/.]\d{1,2}', text):
-        return True
-        
-    # Skip codes and technical strings
-    if re.match(r'^code:?\s*[\'"]?\d+[\'"]?$', text.lower().strip()):
-        return True
-    # Skip GUIDs and technical identifiers (both with and without curly braces)
-    if re.match(r'[{]?[0-9a-f]{8}[-]?([0-9a-f]{4}[-]?){3}[0-9a-f]{12}[}]?', text.lower()):
-        return True
-    # Skip any text that looks like a technical identifier (alphanumeric with dashes)
-    if re.match(r'^[{]?[0-9a-f-]+[}]?$', text.lower()):
-        return True
-    if '<br/>' in text and len(text.replace('<br/>', '').strip()) < 3:
-        return True
-    # Skip single words that are likely technical identifiers
-    if len(text.split()) == 1 and (text.isupper() or text.islower()) and len(text) <= 4:
-        return True
-    # Skip any string that's just a number or code with optional quotes
-    if re.match(r'^[\'"]?\d+[\'"]?$', text.strip()):
+    return text_rules.skip(text)
+
+class TokenBucket:
+    """Token bucket rate limiter shared by all translation workers"""
+
+    def __init__(self, rate=REQUESTS_PER_SECOND, capacity=MAX_WORKERS):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            metrics.add('rate_limit_sleep_seconds', wait)
+            time.sleep(wait)
+
+    def try_acquire(self):
+        """Take a token if one is available and return 0, or return the seconds until one will be"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if now >= self.blocked_until and self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+
+    def backoff(self, delay):
+        """Pause all workers for delay seconds after a rate limit response"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            self.tokens = 0
+
+rate_limiter = TokenBucket()
+
+class AdaptiveConcurrency:
+    """AIMD limit on the in-flight requests of one provider
+
+    Every success adds 1/limit (about one more request per round trip); a 429 halves the limit
+    and a response much slower than the average cuts it by a tenth, at most once per round trip.
+    The caller holds the provider pool's lock.
+    """
+
+    def __init__(self, initial=MAX_WORKERS, minimum=1, maximum=MAX_CONCURRENCY):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.latency = None  # Moving average of the response time
+        self.decreased = 0.0
+
+    def has_room(self):
+        return self.in_flight < int(self.limit)
+
+    def succeeded(self, latency):
+        if self.latency is not None and latency > LATENCY_TOLERANCE * self.latency:
+            self.decrease(0.9)
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self.latency = latency if self.latency is None else 0.9 * self.latency + 0.1 * latency
+
+    def throttled(self):
+        self.decrease(0.5)
+
+    def decrease(self, factor):
+        now = time.monotonic()
+        if now - self.decreased < (self.latency or 1.0):  # Requests already in flight saw the old limit
+            return
+        self.limit = max(self.minimum, self.limit * factor)
+        self.decreased = now
+
+class CircuitBreaker:
+    """Stops requests to a provider after repeated failures or while it throttles, then probes it again
+
+    The caller holds the provider pool's lock.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, reset=BREAKER_RESET):
+        self.threshold = failures
+        self.reset = reset
+        self.failures = 0
+        self.open_until = 0.0
+        self.broken_until = 0.0  # Open because of errors, not a throttling cool-down
+        self.probing = False
+
+    def wait(self, now):
+        """Get the seconds until the circuit lets a request through again"""
+        return max(0.0, self.open_until - now)
+
+    def broken(self, now):
+        """Check whether the circuit is open because the provider keeps failing"""
+        return now < self.broken_until
+
+    def allow(self, now):
+        if now < self.open_until or self.probing:
+            return False
+        if self.failures >= self.threshold:  # Half open: one probe decides whether to close again
+            self.probing = True
         return True
-        
-    return False
 
-def translate_text(text, from_lang='nl', to_lang='en', retry_delay=10, max_retries=3):
-    """Translate a single text with retries and caching"""
-    if should_skip_translation(text):
-        return text
+    def succeeded(self):
+        self.failures = 0
+        self.probing = False
+
+    def failed(self, now, cooldown=None):
+        """Record a failure; a throttled provider is closed for cooldown seconds"""
+        self.failures += 1
+        self.probing = False
+        if cooldown is not None:
+            self.open_until = max(self.open_until, now + cooldown)
+        elif self.failures >= self.threshold and now >= self.open_until:  # Not for requests sent before it opened
+            self.open_until = self.broken_until = now + self.reset
+            metrics.add('circuits_opened')
+            logger.warning(f"Circuit opened after {self.failures} failures, retrying in {self.reset} seconds")
+
+class TranslatorBackend(abc.ABC):
+    """Interface of a translation provider"""
+
+    name = None
+
+    @abc.abstractmethod
+    def translate(self, text, from_lang, to_lang):
+        """Translate text, raising an exception whose message contains 429 when throttled"""
+        raise NotImplementedError
+
+class TranslatorsBackend(TranslatorBackend):
+    """A provider of the translators package (Bing by default)"""
+
+    def __init__(self, translator=DEFAULT_BACKEND):
+        self.name = translator
+
+    def translate(self, text, from_lang, to_lang):
+        # Imported on first use: the package contacts the network when it is imported
+        import translators as ts
+        return ts.translate_text(text, from_language=from_lang, to_language=to_lang, translator=self.name)
+
+class LocalBackend(TranslatorBackend):
+    """Deterministic offline stand-in with configurable latency, error and 429 injection"""
+
+    name = 'local'
+
+    def __init__(self, latency=0.0, error_rate=0.0, throttle_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.seed = seed
+        self.attempts = Counter()
+        self.lock = threading.Lock()
+
+    def translate(self, text, from_lang, to_lang):
+        with self.lock:
+            self.attempts[text] += 1
+            attempt = self.attempts[text]
+        time.sleep(self.latency)
+        # Faults depend only on the text and attempt number, so runs repeat regardless of thread timing
+        roll = random.Random(f"{self.seed}:{attempt}:{text}").random()
+        if roll < self.throttle_rate:
+            raise Exception("429 Too Many Requests (local backend)")
+        if roll < self.throttle_rate + self.error_rate:
+            raise Exception("Injected error (local backend)")
+        return BATCH_SEPARATOR.join(f"[{to_lang}] {line}" for line in text.split(BATCH_SEPARATOR))
+
+def create_backend(spec):
+    """Get the backend for a provider name, or 'local:option=value,...' for the offline stand-in"""
+    name, _, options = spec.partition(':')
+    if name != 'local':
+        return TranslatorsBackend(name)
+    settings = dict(option.split('=', 1) for option in options.split(',') if option)
+    return LocalBackend(**{key: (int if key == 'seed' else float)(value) for key, value in settings.items()})
+
+class Provider:
+    """A translation backend with its own adaptive concurrency, circuit breaker and 429 cool-down"""
+
+    def __init__(self, backend, name=None):
+        self.backend = backend
+        self.name = name or backend.name
+        self.concurrency = AdaptiveConcurrency()
+        self.breaker = CircuitBreaker()
+        self.cooldown = None  # Doubles on consecutive 429s, reset by a success
+
+class ProviderPool:
+    """Providers in order of preference; requests go to the first one with a closed circuit and room"""
+
+    def __init__(self, backends):
+        names = [backend.name for backend in backends]
+        self.providers = [Provider(backend, f"{backend.name}{i + 1}" if names.count(backend.name) > 1 else None)
+                          for i, backend in enumerate(backends)]
+        self.condition = threading.Condition()
+        # Every request on it holds a provider slot, so it never has to queue one behind another
+        self.hedge_pool = ThreadPoolExecutor(max_workers=self.capacity(), thread_name_prefix='hedge')
+
+    def capacity(self):
+        """Get the most requests that can be in flight at once"""
+        return sum(provider.concurrency.maximum for provider in self.providers)
+
+    def try_acquire(self, tried=(), fallback=True):
+        """Reserve a slot at the first available provider, preferring ones not tried yet, or get None"""
+        now = time.monotonic()
+        candidates = [provider for provider in self.providers if provider not in tried]
+        if fallback:
+            candidates += [provider for provider in self.providers if provider in tried]
+        with self.condition:
+            for provider in candidates:
+                if provider.concurrency.has_room() and provider.breaker.allow(now):
+                    provider.concurrency.in_flight += 1
+                    return provider
+        return None
+
+    def broken(self):
+        """Check whether every provider's circuit is open because of errors"""
+        now = time.monotonic()
+        return all(provider.breaker.broken(now) for provider in self.providers)
+
+    def acquire(self, tried=()):
+        """Block until a provider can take a request, or get None when every provider's circuit is broken
+
+        Throttled providers are waited for; failing ones would hold the request until the circuit
+        resets, so it is given up and left to the failures file instead.
+        """
+        while True:
+            provider = self.try_acquire(tried)
+            if provider is not None:
+                return provider
+            with self.condition:
+                if self.broken():
+                    return None
+                now = time.monotonic()
+                wait = min(provider.breaker.wait(now) for provider in self.providers)
+                if wait > 0:
+                    # Every circuit is open: hold back all workers, not only this one
+                    metrics.add('circuit_wait_seconds', wait)
+                    rate_limiter.backoff(wait)
+                self.condition.wait(wait or 1.0)
+
+    def release(self, provider, latency, error=None, retry_delay=RETRY_DELAY):
+        """Free the provider's slot and feed the outcome to its concurrency limit and circuit breaker"""
+        now = time.monotonic()
+        with self.condition:
+            provider.concurrency.in_flight -= 1
+            if error is None:
+                provider.concurrency.succeeded(latency)
+                provider.breaker.succeeded()
+                provider.cooldown = None
+            elif is_throttled(error):
+                provider.concurrency.throttled()
+                provider.cooldown = min(MAX_COOLDOWN, provider.cooldown * 2 if provider.cooldown else retry_delay)
+                provider.breaker.failed(now, provider.cooldown)
+            else:
+                provider.breaker.failed(now)
+            self.condition.notify_all()
+
+    def summary(self):
+        return ', '.join(f"{provider.name} limit {provider.concurrency.limit:.1f}" for provider in self.providers)
+
+def is_throttled(error):
+    """Check whether a provider error is a rate limit response"""
+    return "429" in str(error) or "Too Many Requests" in str(error)
+
+backend = ProviderPool([create_backend(DEFAULT_BACKEND)])
+
+def send_request(provider, text, from_lang, to_lang, retry_delay):
+    """Send one request to a reserved provider, returning the translation or the exception raised"""
+    started = time.perf_counter()
+    error = None
+    try:
+        metrics.add('api_calls')
+        logger.debug(f"Translating with {provider.name}: {text[:100]}...")
+        translated = provider.backend.translate(text, from_lang, to_lang)
+        logger.debug(f"Translated to: {translated[:100]}...")
+        return translated
+    except Exception as e:
+        error = e
+        return e
+    finally:
+        latency = time.perf_counter() - started
+        metrics.add('network_seconds', latency)
+        backend.release(provider, latency, error, retry_delay)
+
+def send_hedged(provider, text, from_lang, to_lang, retry_delay, tried):
+    """Send a request and, if it is slower than hedge_after, the same one to another provider; first answer wins"""
+    first = backend.hedge_pool.submit(send_request, provider, text, from_lang, to_lang, retry_delay)
+    try:
+        return first.result(timeout=hedge_after)
+    except FuturesTimeout:
+        pass
+    # A hedge is only sent when the rate limit and another provider allow it right away
+    second_provider = None if rate_limiter.try_acquire() else backend.try_acquire(tried | {provider}, fallback=False)
+    if second_provider is None:
+        return first.result()
+    tried.add(second_provider)
+    metrics.add('hedged_requests')
+    second = backend.hedge_pool.submit(send_request, second_provider, text, from_lang, to_lang, retry_delay)
+    result = None
+    for future in as_completed([first, second]):
+        result = future.result()
+        if not isinstance(result, Exception):
+            if future is second:
+                metrics.add('hedge_wins')
+            break
+    return result
+
+def request_translation(text, from_lang='nl', to_lang='en', retry_delay=None, max_retries=None):
+    """Send one request through the rate limiter, failing over across providers, returning None on failure"""
+    retry_delay = retry_delay or RETRY_DELAY
+    max_retries = max_retries or MAX_RETRIES
+    tried = set()
+    # Every provider gets at least one attempt before giving up
+    attempts = max_retries + len(backend.providers) - 1
+    for attempt in range(attempts):
+        provider = None
+        if not backend.broken():  # Otherwise the request is given up before it takes a rate limit token
+            rate_limiter.acquire()
+            provider = backend.acquire(tried)
+        if provider is None:
+            metrics.add('circuit_rejections')
+            logger.debug("Every provider's circuit is open, leaving the request for the next run")
+            return None
+        if tried and provider not in tried:
+            metrics.add('failovers')
+        tried.add(provider)
+        if hedge_after is not None and len(backend.providers) > 1:
+            result = send_hedged(provider, text, from_lang, to_lang, retry_delay, tried)
+        else:
+            result = send_request(provider, text, from_lang, to_lang, retry_delay)
+        if not isinstance(result, Exception):
+            return result
         
-    # Clean and normalize the text
-    text = clean_html_text(text)
+        if attempt < attempts - 1:
+            metrics.add('retries')
+        if is_throttled(result):
+            metrics.add('rate_limited')
+            logger.warning(f"Rate limit hit at {provider.name}, cooling it down for {provider.cooldown} seconds...")
+        else:
+            logger.warning(f"Translation error at {provider.name}: {result}")
+            if attempt < attempts - 1 and len(backend.providers) == 1:
+                # A single provider gets a pause; with several the next attempt fails over instead
+                metrics.add('error_sleep_seconds', retry_delay)
+                time.sleep(retry_delay)
+    return None
+
+def lookup_segment(text, to_lang=TARGET_LANG):
+    """Return the cached translation of one cleaned text or sentence, its glossary translation when
+    fully covered, or a translation memory match of a near-identical string"""
+    cached = get_cache(to_lang).get(text.strip().lower())
+    if cached is not None:
+        metrics.add('cache_hits')
+        return cached
     
-    # Check translation cache first
-    cache_key = text.strip().lower()
-    if cache_key in translation_cache:
-        return translation_cache[cache_key]
+    replaced, covered = get_glossary(to_lang).replace(text)
+    if covered:
+        metrics.add('glossary_hits')
+        return clean_html_text(replaced)
     
-    # Check predefined translations
-    translations = get_dutch_translations()
-    if text in translations:
-        return clean_html_text(translations[text])
+    reused = get_translation_memory(to_lang).lookup(text)
+    if reused is not None:
+        metrics.add('fuzzy_hits')
+        return reused
+    metrics.add('cache_misses')
+    return None
+
+def lookup_translation(text, missing=None, to_lang=TARGET_LANG):
+    """Return the known translation of cleaned text, reassembled from its sentences for long texts
+
+    The segments still needing a translation are appended to missing.
+    """
+    pieces = text_rules.segments(text)
+    if len(pieces) == 1:
+        translated = lookup_segment(text, to_lang)
+        if translated is None and missing is not None:
+            missing.append(text)
+        return translated
     
-    for attempt in range(max_retries):
-        try:
-            print(f"Translating: {text[:100]}...")    
-            translated = ts.translate_text(text, from_language=from_lang, to_language=to_lang, translator='bing')
-            translated = clean_html_text(translated)
-            print(f"Translated to: {translated[:100]}...")
-            
-            # Cache successful translation
-            translation_cache[cache_key] = translated
-            if len(translation_cache) % 10 == 0:  # Save cache periodically
-                save_cache()
-                
-            time.sleep(2)  # Wait between translations
-            return translated
-            
-        except Exception as e:
-            if "429" in str(e) or "Too Many Requests" in str(e):
-                print(f"Rate limit hit, waiting {retry_delay} seconds...")
-                time.sleep(retry_delay)
-                retry_delay *= 2
+    # Whole-text entries cached before segmentation stay valid
+    cached = get_cache(to_lang).get(text.strip().lower())
+    if cached is not None:
+        metrics.add('cache_hits')
+        return cached
+    
+    metrics.add('segmented_texts')
+    for i in range(0, len(pieces), 2):
+        segment = pieces[i]
+        translated = segment if text_rules.MARKUP_ONLY.match(segment) else lookup_segment(segment, to_lang)
+        if translated is None:
+            if missing is None:
+                return None
+            missing.append(segment)
+        pieces[i] = translated
+    return None if None in pieces else ''.join(pieces)
+
+def store_translation(cache_key, translated, to_lang=TARGET_LANG):
+    """Cache a successful translation; the store persists each entry as it is written"""
+    with cache_lock:
+        get_cache(to_lang)[cache_key] = translated
+        if to_lang in translation_memories:
+            translation_memories[to_lang].add(cache_key, translated)
+
+class BatchTranslator:
+    """Collect pending strings and translate them in packed, concurrent requests"""
+
+    def __init__(self, from_lang='nl', to_lang='en', max_workers=None,
+                 batch_size=BATCH_SIZE, max_chars=BATCH_MAX_CHARS):
+        self.from_lang = from_lang
+        self.to_lang = to_lang
+        self.max_workers = max_workers  # Defaults to what the providers' adaptive limits can reach
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+        self.pending = {}  # cache key -> cleaned text or sentence
+        self.failed = {}  # cache key -> text that no provider could translate
+
+    def collect(self, text):
+        """Queue text, or the sentences of a long text, for translation unless skipped or already known"""
+        cleaned = text_rules.decide(text)
+        if cleaned is None:
+            metrics.add('skipped')
+            return text
+        missing = []
+        lookup_translation(cleaned, missing, self.to_lang)
+        for segment in missing:
+            self.pending.setdefault(segment.strip().lower(), segment)
+        return text
+
+    def batches(self):
+        """Split the pending strings into packed request batches"""
+        batch, size = [], 0
+        for cache_key, text in self.pending.items():
+            if batch and (len(batch) >= self.batch_size or size + len(text) > self.max_chars):
+                yield batch
+                batch, size = [], 0
+            batch.append((cache_key, text))
+            size += len(text) + len(BATCH_SEPARATOR)
+        if batch:
+            yield batch
+
+    def translate_batch(self, batch):
+        """Translate one batch in a single request, falling back to one request per segment"""
+        texts = [get_glossary(self.to_lang).replace(text)[0] for _, text in batch]
+        joined = request_translation(BATCH_SEPARATOR.join(texts), self.from_lang, self.to_lang)
+        parts = [None] * len(texts) if joined is None else joined.split(BATCH_SEPARATOR)
+        if joined is not None and len(parts) != len(texts):
+            # The provider merged or split segments, so they cannot be matched up
+            parts = [request_translation(text, self.from_lang, self.to_lang) for text in texts]
+        for (cache_key, text), translated in zip(batch, parts):
+            if translated:
+                store_translation(cache_key, clean_html_text(translated), self.to_lang)
             else:
-                print(f"Translation error: {e}")
-                if attempt == max_retries - 1:
-                    return text
-                time.sleep(retry_delay)
+                self.failed[cache_key] = text
+
+    def run(self):
+        """Translate all pending strings concurrently"""
+        run_batch_translators([self])
+
+def run_batch_translators(engines):
+    """Translate the pending strings of several engines (one per target language) on one thread pool
+
+    Batches of the languages are interleaved, so every language progresses at the same time
+    while all requests still share the provider's rate limiter.
+    """
+    jobs = [job for job in chain.from_iterable(zip_longest(*(
+        [(engine, batch) for batch in engine.batches()] for engine in engines))) if job is not None]
+    if not jobs:
+        return
+    pending = sum(len(engine.pending) for engine in engines)
+    languages = f" into {len(engines)} languages" if len(engines) > 1 else ""
+    logger.info(f"Translating {pending} unique strings{languages} in {len(jobs)} requests...")
+    workers = max(engine.max_workers or backend.capacity() for engine in engines)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(progress(pool.map(lambda job: job[0].translate_batch(job[1]), jobs), total=len(jobs),
+                      desc="Translating batches"))
+    for engine in engines:
+        engine.pending.clear()
+    logger.info(f"Provider concurrency: {backend.summary()}")
+
+def load_failures(path=FAILURES_FILE):
+    """Load the strings earlier runs could not translate, per target language"""
+    try:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading failed strings: {e}")
+    return {}
+
+def save_failures(engines, path=FAILURES_FILE):
+    """Record the strings that still could not be translated, with the number of runs they failed in
+
+    They stay untranslated in the pages (whose manifest entries stay pending) and are retried first
+    by the next run.
+    """
+    failures = load_failures(path)
+    for engine in engines:
+        previous = failures.pop(engine.to_lang, {})
+        entries = {cache_key: {'text': text, 'runs': previous.get(cache_key, {}).get('runs', 0) + 1}
+                   for cache_key, text in engine.failed.items()}
+        if entries:
+            failures[engine.to_lang] = entries
+    count = sum(len(engine.failed) for engine in engines)
+    if count:
+        metrics.add('failed_strings', count)
+        logger.warning(f"{count} strings could not be translated and will be retried next run (see {path})")
+    if failures:
+        write_atomic(path, json.dumps(failures, ensure_ascii=False, indent=1).encode('utf-8'))
+    elif os.path.exists(path):
+        os.remove(path)
+
+# One argument of a tocTab `new Array(...)` call: a quoted string or a bare value, then ',' or ')'
+TOC_ARRAY = b'new Array('
+TOC_ARGUMENT = re.compile(rb'\s*(?:"((?:[^"\\]|\\.)*)"|\'((?:[^\'\\]|\\.)*)\'|[^,)]*?)\s*([,)])', re.DOTALL)
+TOC_TITLE_FIELD = 2
+# Other tocTab fields: TOC number, page, package GUID (naming the child tocTab file), type, element GUID
+TOC_ID_FIELD, TOC_PAGE_FIELD, TOC_PACKAGE_FIELD, TOC_TYPE_FIELD, TOC_GUID_FIELD = 0, 3, 7, 8, 9
+JS_ESCAPES = {'n': '\n', 'r': '\r', 't': '\t', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0'}
+JS_ESCAPE = re.compile(r'\\(?:u([dD][89abAB][0-9a-fA-F]{2})\\u([dD][c-fC-F][0-9a-fA-F]{2})|u([0-9a-fA-F]{4})|x([0-9a-fA-F]{2})|(.))',
+                       re.DOTALL)
+# Characters that end a JavaScript string literal unless escaped
+JS_LINE_ESCAPES = {'\n': '\\n', '\r': '\\r', '\u2028': '\\u2028', '\u2029': '\\u2029'}
+
+def decode_js_escape(match):
+    high, low, code, byte, char = match.groups()
+    if high:  # Surrogate pair for a character outside the BMP
+        return chr(0x10000 + ((int(high, 16) - 0xD800) << 10) + int(low, 16) - 0xDC00)
+    if code or byte:
+        code_point = int(code or byte, 16)
+        return '\ufffd' if 0xD800 <= code_point <= 0xDFFF else chr(code_point)  # Lone surrogate
+    return JS_ESCAPES.get(char, char)
+
+def unescape_js(text):
+    """Decode the backslash escapes of a JavaScript string literal, \\uXXXX and \\xHH included"""
+    return JS_ESCAPE.sub(decode_js_escape, text)
+
+def escape_js(text, quote):
+    """Encode text for a JavaScript string literal delimited by quote"""
+    text = text.replace('\\', '\\\\').replace(quote, '\\' + quote)
+    for char, escaped in JS_LINE_ESCAPES.items():
+        text = text.replace(char, escaped)
     return text
 
-def translate_xml_files():
-    """Translate all XML files in js/data directory"""
-    xml_dir = os.path.join("js", "data")
+def scan_toc_entries(data):
+    """Yield the argument matches of every tocTab `new Array(...)` call"""
+    position = data.find(TOC_ARRAY)
+    while position != -1:
+        i = position + len(TOC_ARRAY)
+        arguments = []
+        while True:
+            match = TOC_ARGUMENT.match(data, i)
+            if match is None:  # Unterminated string or call
+                yield arguments
+                return
+            arguments.append(match)
+            i = match.end()
+            if match.group(3) == b')':
+                break
+        yield arguments
+        position = data.find(TOC_ARRAY, i)
+
+def toc_literal(match):
+    """Get the group holding a string argument, or None for a bare value"""
+    return 1 if match.group(1) is not None else 2 if match.group(2) is not None else None
+
+def toc_fields(arguments):
+    """Decode the arguments of one tocTab entry, with '' for bare values"""
+    fields = []
+    for match in arguments:
+        group = toc_literal(match)
+        fields.append('' if group is None else unescape_js(match.group(group).decode('utf-8')))
+    return fields
+
+def scan_toc_titles(data):
+    """Yield (start, end, quote, title) for the title literal of every tocTab entry, as byte offsets"""
+    for arguments in scan_toc_entries(data):
+        if len(arguments) > TOC_TITLE_FIELD:
+            match = arguments[TOC_TITLE_FIELD]
+            group = toc_literal(match)
+            if group is not None:
+                quote = '"' if group == 1 else "'"
+                yield match.start(group), match.end(group), quote, unescape_js(match.group(group).decode('utf-8'))
+
+def translate_toc_content(data, translate, label):
+    """Translate the title (3rd element) of every tocTab entry, patching only the changed spans"""
+    pieces, copied = [], 0
+    for start, end, quote, text in scan_toc_titles(data):
+        translated = translate(text)
+        if translated != text:
+            pieces.append(data[copied:start])
+            pieces.append(escape_js(translated, quote).encode('utf-8'))
+            copied = end
+            if label:
+                logger.debug(f"Translated {label}: {text} -> {translated}")
+    if not pieces:
+        return data
+    pieces.append(data[copied:])
+    return b''.join(pieces)
+
+def find_toc_files():
+    """Get all tocTab XML files in js/data (excluding guidmaps)"""
     xml_files = []
-    
-    # Get all XML files (excluding guidmaps)
-    for root, _, files in os.walk(xml_dir):
-        if "guidmaps" not in root:  # Skip guidmaps directory
-            for file in files:
-                if file.endswith(".xml"):
-                    xml_files.append(os.path.join(root, file))
-    
-    print(f"\nTranslating {len(xml_files)} XML files...")
-    for xml_file in tqdm(xml_files, desc="Translating files"):
-        try:
-            with open(xml_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Parse XML-like content (it's actually JavaScript)
-            lines = content.split('\n')
-            new_lines = []
-            for line in lines:
-                if 'new Array(' in line:
-                    # Extract the text part (3rd element in array)
-                    parts = line.split(',')
-                    if len(parts) >= 3:
-                        # Get the text part (usually the 3rd element)
-                        text_part = parts[2].strip()
-                        if text_part.startswith('"') and text_part.endswith('"'):
-                            # Extract text between quotes
-                            text = text_part[1:-1]
-                            # Translate if needed
-                            translated = translate_text(text)
-                            # Replace original text with translation
-                            if translated != text:
-                                parts[2] = f'"{translated}"'
-                                line = ','.join(parts)
-                                print(f"Translated XML item: {text} -> {translated}")
-                new_lines.append(line)
-            
-            # Write back the modified content
-            with open(xml_file, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(new_lines))
-                
-        except Exception as e:
-            print(f"Error processing {xml_file}: {e}")
+    for root, dirs, files in os.walk(TOC_DIR):
+        if "guidmaps" in dirs:
+            dirs.remove("guidmaps")  # GUID to page maps, no tocTab entries
+        for file in files:
+            if file.endswith(".xml"):
+                xml_files.append(os.path.join(root, file))
+    return sorted(xml_files)
 
-def translate_html_files():
-    """Translate all HTML files in EARoot directory"""
+def find_html_files():
+    """Get all HTML files in EARoot recursively"""
     html_files = []
-    
-    # Get all HTML files recursively
     for root, _, files in os.walk("EARoot"):
         for file in files:
             if file.endswith(".htm"):
                 html_files.append(os.path.join(root, file))
+    return sorted(html_files)
+
+class PackageIndex:
+    """GUID -> pages/children index of the export, from the tocTab files and the guidmaps
+
+    Every tocTab entry is a node with its TOC page, the pages the guidmaps list for its GUID
+    and, for packages, the entries of the package's own tocTab file as children. Pages that
+    are in no entry (notes, boundaries) belong to the package whose page directory holds them.
+    """
+
+    def __init__(self):
+        self.nodes = {}  # GUID -> {'id', 'title', 'type', 'toc_file', 'pages', 'children'}
+        self.roots = []  # GUIDs of the entries in root.xml
+
+    @staticmethod
+    def guid(text):
+        return text.strip('{}').upper()
+
+    @classmethod
+    def load(cls, data_dir=TOC_DIR):
+        """Build the index of the export; it stays empty if there is no root.xml"""
+        index = cls()
+        guid_pages = {}
+        guidmap_dir = os.path.join(data_dir, 'guidmaps')
+        if os.path.isdir(guidmap_dir):
+            for name in sorted(os.listdir(guidmap_dir)):
+                with open(os.path.join(guidmap_dir, name), 'r', encoding='utf-8') as f:
+                    for line in f:
+                        guid, _, page = line.strip().rstrip(';').partition('/')
+                        if page:
+                            guid_pages.setdefault(cls.guid(guid), []).append(os.path.join('EARoot', *page.split('/')))
+        
+        root_file = os.path.join(data_dir, 'root.xml')
+        if os.path.exists(root_file):
+            index.roots = index.load_toc_file(root_file, data_dir, guid_pages)
+        index.assign_orphans()
+        return index
+
+    def load_toc_file(self, toc_file, data_dir, guid_pages):
+        """Add the entries of one tocTab file and their descendants, returning their GUIDs"""
+        with open(toc_file, 'rb') as f:
+            data = f.read()
+        children = []
+        for arguments in scan_toc_entries(data):
+            fields = toc_fields(arguments) + [''] * (TOC_GUID_FIELD + 1 - len(arguments))
+            package = self.guid(fields[TOC_PACKAGE_FIELD])
+            guid = self.guid(fields[TOC_GUID_FIELD]) or package
+            if not guid or guid in self.nodes:
+                continue
+            pages = [os.path.normpath(fields[TOC_PAGE_FIELD])] if fields[TOC_PAGE_FIELD] else []
+            node = self.nodes[guid] = {
+                'id': fields[TOC_ID_FIELD], 'title': fields[TOC_TITLE_FIELD], 'type': fields[TOC_TYPE_FIELD],
+                'toc_file': None, 'pages': list(dict.fromkeys(pages + guid_pages.get(guid, []))), 'children': [],
+            }
+            children.append(guid)
+            # A package's entries are in the tocTab file named after its GUID
+            child_file = os.path.join(data_dir, fields[TOC_PACKAGE_FIELD].strip('{}') + '.xml')
+            if package and os.path.exists(child_file):
+                node['toc_file'] = child_file
+                node['children'] = self.load_toc_file(child_file, data_dir, guid_pages)
+        return children
+
+    def assign_orphans(self):
+        """Give every HTML page that no entry lists to the package owning its directory"""
+        claimed = {page for node in self.nodes.values() for page in node['pages']}
+        package_dirs = {}
+        for guid in self.walk():
+            node = self.nodes[guid]
+            if node['toc_file'] and node['pages']:
+                package_dirs.setdefault(os.path.dirname(node['pages'][0]), guid)
+        for page in find_html_files():
+            if page in claimed:
+                continue
+            directory = os.path.dirname(page)
+            while directory and directory not in package_dirs:
+                directory = os.path.dirname(directory)
+            if directory:
+                self.nodes[package_dirs[directory]]['pages'].append(page)
+
+    def walk(self, guid=None):
+        """Yield the GUIDs of a subtree (or the whole TOC) depth first, in TOC order"""
+        stack = [guid] if guid else list(reversed(self.roots))
+        while stack:
+            guid = stack.pop()
+            yield guid
+            stack.extend(reversed(self.nodes[guid]['children']))
+
+    def find(self, name):
+        """Get the GUIDs of the packages matching a GUID, TOC number or title"""
+        wanted = name.strip().lower()
+        return [guid for guid, node in self.nodes.items() if node['toc_file'] and
+                wanted in (guid.lower(), '{' + guid.lower() + '}', node['id'].lower(), node['title'].strip().lower())]
+
+    def files(self, guid=None):
+        """Get the tocTab and HTML files of a package subtree (or the whole export), in TOC order"""
+        toc_files, pages = [], []
+        if guid is None:
+            toc_files.append(os.path.join(TOC_DIR, 'root.xml'))
+        for node in map(self.nodes.get, self.walk(guid)):
+            if node['toc_file']:
+                toc_files.append(node['toc_file'])
+            pages.extend(node['pages'])
+        toc_files = list(dict.fromkeys(toc_files))
+        pages = [page for page in dict.fromkeys(pages) if os.path.exists(page)]
+        if guid is None:
+            # Files the TOC does not reach still belong to the export
+            toc_files += sorted(set(find_toc_files()) - set(toc_files))
+            pages += sorted(set(find_html_files()) - set(pages))
+        return toc_files + pages
+
+def translate_soup(soup, translate, verbose):
+    """Translate the title, ObjectTitle and text elements of a parsed page"""
+    # Translate title tag
+    title_tag = soup.find('title')
+    if title_tag and title_tag.string:
+        original = title_tag.string.strip()
+        translated = translate(original)
+        if translated != original:
+            title_tag.string.replace_with(translated)
+            if verbose:
+                logger.debug(f"Translated title: {original} -> {translated}")
+    
+    # Translate ObjectTitle div
+    obj_title = soup.find('div', class_='ObjectTitle')
+    if obj_title and obj_title.string:
+        original = obj_title.string.strip()
+        if ': ' in original:  # Handle "title: type" format
+            title_part, type_part = original.split(': ', 1)
+            translated_title = translate(title_part)
+            translated = f"{translated_title}: {type_part}"
+        else:
+            translated = translate(original)
+        if translated != original:
+            obj_title.string.replace_with(translated)
+            if verbose:
+                logger.debug(f"Translated object title: {original} -> {translated}")
+    
+    # Translate other text content
+    for elem in soup.find_all(['h1', 'h2', 'h3', 'p', 'div', 'span', 'td', 'th']):
+        if 'ObjectTitle' not in (elem.get('class') or []) and elem.string and elem.string.strip():  # Skip ObjectTitle as it's handled above
+            original = elem.string.strip()
+            translated = translate(original)
+            if translated != original:
+                elem.string.replace_with(translated)
+                if verbose:
+                    logger.debug(f"Translated HTML: {original} -> {translated}")
+
+# Elements whose only text is translated, as with BeautifulSoup's .string
+HTML_TEXT_TAGS = frozenset(['title', 'h1', 'h2', 'h3', 'p', 'div', 'span', 'td', 'th'])
+HTML_VOID_TAGS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                            'param', 'source', 'track', 'wbr'])
+# Comments, declarations (DOCTYPE), processing instructions, and start or end tags with their attributes
+HTML_TOKEN = re.compile(r'<!--.*?(?:-->|$)|<![^>]*>?|<\?[^>]*>?'
+                        r'|<(/?)([a-zA-Z][\w:.-]*)((?:"[^"]*"|\'[^\']*\'|[^\'">])*)>', re.DOTALL)
+HTML_RAW_TEXT_END = {
+    'script': re.compile(r'</script\s*>', re.IGNORECASE),
+    'style': re.compile(r'</style\s*>', re.IGNORECASE),
+}
+HTML_CLASS = re.compile(r'\bclass\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s\'">]+))', re.IGNORECASE)
+
+def scan_html_strings(content):
+    """Yield (start, end, object_title) for each text that is the only content of a text element
+
+    Elements are tracked on a stack while the markup is scanned; an element whose single child
+    is a text, or an element holding a single text, owns that text. Scripts, styles, comments
+    and the DOCTYPE are never text. Each text is yielded once, in document order.
+    """
+    found = {}  # (start, end) -> owned by a div.ObjectTitle
+    stack = []  # [tag, classes, children, text span]
     
-    print(f"\nTranslating {len(html_files)} HTML files...")
-    for html_file in tqdm(html_files, desc="Translating files"):
+    def add_child(span=None):
+        if stack:
+            element = stack[-1]
+            element[2] += 1
+            element[3] = span if element[2] == 1 else None
+    
+    def close(element):
+        tag, classes, children, span = element
+        if children != 1 or span is None:
+            return
+        if tag in HTML_TEXT_TAGS:
+            object_title = tag == 'div' and 'ObjectTitle' in classes
+            found[span] = found.get(span, False) or object_title
+        if stack and stack[-1][2] == 1:  # The parent holds this element alone, so it owns the text too
+            stack[-1][3] = span
+    
+    position = 0
+    for match in HTML_TOKEN.finditer(content):
+        if match.start() < position:  # Inside a script or style skipped below
+            continue
+        if match.start() > position:
+            add_child((position, match.start()))
+        position = match.end()
+        
+        tag = match.group(2)
+        if tag is None:  # Comment, declaration or processing instruction
+            add_child()
+            continue
+        tag = tag.lower()
+        if match.group(1):
+            if any(element[0] == tag for element in stack):
+                while True:
+                    element = stack.pop()
+                    close(element)
+                    if element[0] == tag:
+                        break
+            continue
+        
+        add_child()
+        attributes = match.group(3)
+        if tag in HTML_RAW_TEXT_END:
+            end = HTML_RAW_TEXT_END[tag].search(content, position)
+            position = end.end() if end else len(content)
+        elif tag not in HTML_VOID_TAGS and not attributes.rstrip().endswith('/'):
+            classes = HTML_CLASS.search(attributes)
+            classes = next(value for value in classes.groups() if value is not None).split() if classes else []
+            stack.append([tag, classes, 0, None])
+    if position < len(content):
+        add_child((position, len(content)))
+    while stack:
+        close(stack.pop())
+    
+    for (start, end), object_title in sorted(found.items()):
+        yield start, end, object_title
+
+def translate_html_content(data, translate, verbose):
+    """Translate the texts of an HTML page, copying every other byte through unchanged"""
+    content = data.decode('utf-8')
+    pieces, copied = [], 0
+    for start, end, object_title in scan_html_strings(content):
+        raw = content[start:end]
+        core = raw.strip()
+        if not core:
+            continue
+        original = html.unescape(core)
+        if object_title and ': ' in original:  # Handle "title: type" format
+            title_part, type_part = original.split(': ', 1)
+            translated = f"{translate(title_part)}: {type_part}"
+        else:
+            translated = translate(original)
+        if translated == original:
+            continue
+        core_start = start + raw.index(core)
+        pieces.append(content[copied:core_start])
+        pieces.append(html.escape(translated, quote=False))
+        copied = core_start + len(core)
+        if verbose:
+            logger.debug(f"Translated HTML: {original} -> {translated}")
+    if not pieces:
+        return data
+    pieces.append(content[copied:])
+    return ''.join(pieces).encode('utf-8')
+
+def translate_file_content(file_path, data, translate, verbose, parser=HTML_PARSER):
+    """Translate the raw bytes of a tocTab or HTML file with the given translate function"""
+    if file_path.endswith(".xml"):
+        label = ("menu item" if os.path.basename(file_path) == 'root.xml' else "XML item") if verbose else None
+        return translate_toc_content(data, translate, label)
+    if parser == 'stream':
+        return translate_html_content(data, translate, verbose)
+    content = data.decode('utf-8')
+    soup = BeautifulSoup(content, parser)
+    translate_soup(soup, translate, verbose)
+    new_content = str(soup)
+    return data if new_content == content else new_content.encode('utf-8')
+
+def hash_file(file_path):
+    """Get the content hash of a file on disk"""
+    with open(file_path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+class Manifest:
+    """Content hashes of the processed input files and of their translated output"""
+
+    def __init__(self, data=None):
+        data = data or {}
+        self.rules_version = data.get('rules_version')
+        self.files = data.get('files', {})  # path -> {'size', 'mtime_ns', 'source_hash', 'output_hash', 'pending'}
+
+    @classmethod
+    def load(cls, path=MANIFEST_FILE):
         try:
-            with open(html_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Parse HTML
-            soup = BeautifulSoup(content, 'html.parser')
-            
-            # Translate title tag
-            title_tag = soup.find('title')
-            if title_tag and title_tag.string:
-                original = title_tag.string.strip()
-                translated = translate_text(original)
-                if translated != original:
-                    title_tag.string.replace_with(translated)
-                    print(f"Translated title: {original} -> {translated}")
-            
-            # Translate ObjectTitle div
-            obj_title = soup.find('div', class_='ObjectTitle')
-            if obj_title and obj_title.string:
-                original = obj_title.string.strip()
-                if ': ' in original:  # Handle "title: type" format
-                    title_part, type_part = original.split(': ', 1)
-                    translated_title = translate_text(title_part)
-                    translated = f"{translated_title}: {type_part}"
-                else:
-                    translated = translate_text(original)
-                if translated != original:
-                    obj_title.string.replace_with(translated)
-                    print(f"Translated object title: {original} -> {translated}")
-            
-            # Translate other text content
-            for elem in soup.find_all(['h1', 'h2', 'h3', 'p', 'div', 'span', 'td', 'th']):
-                if elem.get('class') != 'ObjectTitle' and elem.string and elem.string.strip():  # Skip ObjectTitle as it's handled above
-                    original = elem.string.strip()
-                    translated = translate_text(original)
-                    if translated != original:
-                        elem.string.replace_with(translated)
-                        print(f"Translated HTML: {original} -> {translated}")
-            
-            # Write back the modified content
-            with open(html_file, 'w', encoding='utf-8') as f:
-                f.write(str(soup))
-                
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    return cls(json.load(f))
         except Exception as e:
-            print(f"Error processing {html_file}: {e}")
+            logger.error(f"Error loading manifest: {e}")
+        return cls()
+
+    def save(self, path=MANIFEST_FILE):
+        data = json.dumps({'rules_version': self.rules_version, 'files': self.files}, ensure_ascii=False)
+        write_atomic(path, data.encode('utf-8'))
+
+    def is_current(self, file_path):
+        """Check whether a file is unchanged since it was last written with every string translated"""
+        entry = self.files.get(file_path)
+        if not entry or entry['pending'] or not os.path.exists(file_path):
+            return False
+        stat = os.stat(file_path)
+        if stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']:
+            return True
+        return hash_file(file_path) == entry['output_hash']
+
+    def changed_files(self, file_paths):
+        """Get the files that are new or changed since the last run"""
+        return [file_path for file_path in file_paths if not self.is_current(file_path)]
+
+    def record(self, file_path, source_hash, pending):
+        """Record a processed file; pending files still contain untranslated strings"""
+        stat = os.stat(file_path)
+        self.files[file_path] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'source_hash': source_hash,
+            'output_hash': hash_file(file_path),
+            'pending': pending,
+        }
+
+class RunJournal:
+    """Append-only log of a run's progress: extracted files, finished stages and written files"""
+
+    def __init__(self, path=RUN_JOURNAL):
+        self.path = path
+        self.file = None
+
+    def load(self):
+        """Get the state of the last run, or None when it finished or no journal exists"""
+        state = {'files': [], 'full_run': False, 'extracted': {}, 'stages': set(), 'written': set()}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:  # Torn last line of a crashed run
+                        break
+                    event = record['event']
+                    if event == 'start':
+                        state['files'] = record['files']
+                        state['full_run'] = record['full_run']
+                    elif event == 'extracted':
+                        state['extracted'][record['file']] = (record['hash'], record['units'])
+                    elif event == 'stage':
+                        state['stages'].add(record['stage'])
+                    elif event == 'written':
+                        state['written'].add(record['file'])
+                    elif event == 'finish':
+                        return None
+        except FileNotFoundError:
+            return None
+        return state if state['files'] or state['stages'] else None
+
+    def start(self, file_paths, full_run):
+        """Begin a new run, discarding the previous journal"""
+        self.file = open(self.path, 'w', encoding='utf-8')
+        self.record('start', files=file_paths, full_run=full_run)
+
+    def reopen(self):
+        """Continue appending to the journal of an interrupted run"""
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.record('resume')
+
+    def record(self, event, **fields):
+        self.file.write(json.dumps({'event': event, **fields}, ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    def extracted(self, file_path, source_hash, units):
+        self.record('extracted', file=file_path, hash=source_hash, units=units)
+
+    def written(self, file_path):
+        self.record('written', file=file_path)
 
-def translate_menu_xml():
-    """Translate the menu structure XML files"""
-    menu_files = ['root.xml']  # Add other menu files if needed
-    xml_dir = os.path.join("js", "data")
+    def finish(self):
+        self.record('finish')
+        self.file.close()
+
+class TranslationCatalog:
+    """Project-wide catalog of translatable units keyed by normalized text"""
+
+    def __init__(self, entries=None, sources=None):
+        self.entries = entries or {}  # cache key -> {'text': ..., 'occurrences': [[file, position], ...]}
+        self.sources = sources or {}  # every scanned file -> content hash at extraction
+
+    def add(self, text, file_path, position):
+        """Record one occurrence of a (cleaned) translatable text"""
+        entry = self.entries.setdefault(text.strip().lower(), {'text': text, 'occurrences': []})
+        entry['occurrences'].append([file_path, position])
+
+    def add_file(self, file_path, source_hash, units):
+        """Record a scanned file and its (position, cleaned text) units"""
+        self.sources[file_path] = source_hash
+        for position, text in units:
+            self.add(text, file_path, position)
+
+    def subset(self, file_paths):
+        """Get the catalog of some of the files, with only their occurrences of each entry"""
+        wanted = set(file_paths)
+        subset = TranslationCatalog(sources={file_path: self.sources[file_path]
+                                             for file_path in file_paths if file_path in self.sources})
+        for cache_key, entry in self.entries.items():
+            occurrences = [occurrence for occurrence in entry['occurrences'] if occurrence[0] in wanted]
+            if occurrences:
+                subset.entries[cache_key] = {'text': entry['text'], 'occurrences': occurrences}
+        return subset
+
+    def chunks(self, size):
+        """Split the catalog into catalogs of size files each, in extraction (TOC) order"""
+        file_paths = list(self.sources)
+        return [self.subset(file_paths[i:i + size]) for i in range(0, len(file_paths), size)]
+
+    def files(self):
+        """Get the files that contain at least one translatable unit"""
+        return sorted({file_path for entry in self.entries.values() for file_path, _ in entry['occurrences']})
+
+    def save(self, path=CATALOG_FILE):
+        """Save the catalog so later stages can run without re-extracting"""
+        write_atomic(path, json.dumps({'sources': self.sources, 'entries': self.entries}, ensure_ascii=False).encode('utf-8'))
+        logger.info(f"Saved catalog with {len(self.entries)} unique strings to {path}")
+
+    @classmethod
+    def load(cls, path=CATALOG_FILE):
+        """Load a catalog written by a previous extract stage"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['entries'], data['sources'])
+
+def extract_file(file_path, parser=HTML_PARSER):
+    """Parse one file in a worker process and return its content hash and translatable units"""
+    texts = []
     
-    print("\nTranslating menu structure...")
-    for menu_file in menu_files:
-        file_path = os.path.join(xml_dir, menu_file)
+    def record(text):
+        texts.append(text)
+        return text
+    
+    timings = Counter()
+    try:
+        started = time.perf_counter()
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        source_hash = hashlib.sha1(data).hexdigest()
+        timings['read_seconds'] = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        translate_file_content(file_path, data, record, False, parser)
+        # Skip and normalize the whole page's texts in one pass
+        units = [(position, text) for position, text in enumerate(text_rules.classify(texts)) if text is not None]
+        timings['parse_seconds'] = time.perf_counter() - started
+        timings['skipped'] = len(texts) - len(units)
+        return file_path, source_hash, units, timings
+    except Exception as e:
+        logger.error(f"Error extracting {file_path}: {e}")
+        return file_path, None, [], timings
+
+def write_atomic(file_path, data):
+    """Replace a file through a temporary file and rename, so it is never left half-written"""
+    temp_path = f"{file_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def link_file(source, target):
+    """Point target at an unchanged source file with a hard link (a copy where links fail), atomically"""
+    temp_path = f"{target}.{os.getpid()}.tmp"
+    try:
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Parse XML-like content
-            lines = content.split('\n')
-            new_lines = []
-            for line in lines:
-                if 'new Array(' in line:
-                    # Extract and translate the title (3rd element)
-                    parts = line.split(',')
-                    if len(parts) >= 3:
-                        text_part = parts[2].strip()
-                        if text_part.startswith('"') and text_part.endswith('"'):
-                            text = text_part[1:-1]
-                            translated = translate_text(text)
-                            if translated != text:
-                                parts[2] = f'"{translated}"'
-                                line = ','.join(parts)
-                                print(f"Translated menu item: {text} -> {translated}")
-                new_lines.append(line)
-            
-            # Write back the modified content
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(new_lines))
-                
-        except Exception as e:
-            print(f"Error processing menu file {menu_file}: {e}")
+            os.link(source, temp_path)
+        except OSError:
+            shutil.copyfile(source, temp_path)
+        os.replace(temp_path, target)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def link_shared_files(output_dir):
+    """Link the untranslated parts of the export into an output tree
 
-def clear_and_rebuild_cache():
-    """Clear the translation cache and rebuild it with current rules"""
-    global translation_cache
-    old_cache = translation_cache.copy()
-    translation_cache = {}
+    The index, TOC frame, styles and images are symlinked as a whole; the other files under
+    EARoot and js that are not translated (diagram images) are hard linked one by one.
+    """
+    for name in SHARED_EXPORT_FILES:
+        target = os.path.join(output_dir, name)
+        if not os.path.exists(name) or os.path.lexists(target):
+            continue
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        try:
+            os.symlink(os.path.relpath(name, os.path.dirname(target) or '.'), target)
+        except OSError:  # No symlink permission (Windows without developer mode)
+            if os.path.isdir(name):
+                shutil.copytree(name, target)
+            else:
+                shutil.copy2(name, target)
     
-    print("Clearing and rebuilding translation cache...")
-    for dutch_text, english_text in tqdm(old_cache.items(), desc="Processing cache entries"):
-        if not should_skip_translation(dutch_text):
-            # Re-translate using current rules
-            new_translation = translate_text(dutch_text)
-            if new_translation != dutch_text:  # Only cache if actually translated
-                translation_cache[dutch_text] = new_translation
-        else:
+    skipped = set(find_toc_files() + find_html_files()) | {os.path.normpath(name) for name in SHARED_EXPORT_FILES}
+    for top in ('EARoot', 'js'):
+        for root, dirs, files in os.walk(top):
+            dirs[:] = [name for name in dirs if os.path.join(root, name) not in skipped]
+            for file in files:
+                source = os.path.join(root, file)
+                target = os.path.join(output_dir, source)
+                if source in skipped or (os.path.exists(target) and os.path.samefile(source, target)):
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                link_file(source, target)
+                metrics.add('files_linked')
+
+def apply_file(file_path, translations, parser=HTML_PARSER, output_path=None):
+    """Rewrite one file in a worker process using translations looked up by the parent
+
+    With output_path the source is left alone and the result goes there, hard linked if unchanged.
+    Returns the path, its timings and whether the file was written (or already current).
+    """
+    def translate(text):
+        cleaned = text_rules.decide(text)
+        if cleaned is None:
+            return text
+        # Untranslated strings keep their source bytes, so the next run extracts them again
+        return translations.get(cleaned.strip().lower(), text)
+    
+    timings = Counter()
+    try:
+        started = time.perf_counter()
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        new_data = translate_file_content(file_path, data, translate, True, parser)
+        timings['parse_seconds'] = time.perf_counter() - started
+        
+        # Write back the modified content
+        if output_path:
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            if new_data != data and os.path.exists(output_path) and not os.path.samefile(file_path, output_path):
+                with open(output_path, 'rb') as f:
+                    if f.read() == new_data:  # Left by a previous run into the same tree
+                        return file_path, timings, True
+        if new_data != data:
+            started = time.perf_counter()
+            write_atomic(output_path or file_path, new_data)
+            timings['write_seconds'] = time.perf_counter() - started
+            timings['files_written'] = 1
+        elif output_path and not (os.path.exists(output_path) and os.path.samefile(file_path, output_path)):
+            link_file(file_path, output_path)
+            timings['files_linked'] = 1
+    except Exception as e:
+        logger.error(f"Error processing {file_path}: {e}")
+        return file_path, timings, False
+    return file_path, timings, True
+
+def run_in_processes(function, *iterables, desc, workers=None):
+    """Map a per-file function over a process pool, yielding results as they arrive"""
+    if not iterables[0]:
+        return
+    workers = workers or PARSE_WORKERS
+    chunksize = max(1, len(iterables[0]) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from progress(pool.map(function, *iterables, chunksize=chunksize), total=len(iterables[0]), desc=desc)
+
+def extract_catalog(file_paths, parser=HTML_PARSER, catalog=None, on_extracted=None):
+    """Stage 1: extract every translatable unit of the given files into one catalog"""
+    catalog = catalog or TranslationCatalog()
+    
+    logger.info(f"Extracting strings from {len(file_paths)} files...")
+    results = run_in_processes(extract_file, file_paths, [parser] * len(file_paths), desc="Extracting")
+    for file_path, source_hash, units, timings in results:
+        add_file_timings(file_path, timings)
+        if source_hash is None:
+            continue
+        catalog.add_file(file_path, source_hash, units)
+        if on_extracted:
+            on_extracted(file_path, source_hash, units)
+    
+    occurrences = sum(len(entry['occurrences']) for entry in catalog.entries.values())
+    logger.info(f"Extracted {occurrences} strings, {len(catalog.entries)} unique")
+    return catalog
+
+def translate_catalog(catalog, to_langs=(TARGET_LANG,), chunk_size=None, on_translated=None):
+    """Stage 2: translate the unique catalog entries that are not cached yet, into every target language
+
+    With chunk_size the catalog is translated chunk_size files at a time in TOC order, and
+    on_translated(chunk, last) is called with each chunk's catalog once its strings are cached,
+    so the top of the TOC can be written while the rest is still being translated.
+    """
+    engines = [BatchTranslator(to_lang=to_lang) for to_lang in to_langs]
+    failures = load_failures()
+    chunks = (catalog.chunks(chunk_size) if chunk_size else []) or [catalog]
+    for number, chunk in enumerate(chunks, 1):
+        for engine in engines:
+            # Strings that failed before go first
+            for cache_key in failures.get(engine.to_lang, {}):
+                if cache_key in chunk.entries:
+                    engine.collect(chunk.entries[cache_key]['text'])
+        for entry in chunk.entries.values():
+            for engine in engines:
+                engine.collect(entry['text'])
+        run_batch_translators(engines)
+        if on_translated:
+            on_translated(chunk, number == len(chunks))
+    save_failures(engines)
+
+def apply_catalog(catalog, manifest=None, parser=HTML_PARSER, done=(), on_written=None, complete=True,
+                  to_lang=TARGET_LANG, output_dir=None):
+    """Stage 3: write cached translations into every file of the catalog, without network
+
+    Files are written in extraction (TOC) order; those in done were already written by an
+    interrupted run and are left alone. A run that was not complete (one package under new
+    rules) leaves the manifest's rules version alone so the rest of the export is redone later.
+    With output_dir every file goes to the same path under it instead of being rewritten in place.
+    """
+    # Cache lookups stay in this process; workers only get the translations their file needs
+    file_translations = {}
+    pending = set()
+    for cache_key, entry in catalog.entries.items():
+        translated = lookup_translation(entry['text'], to_lang=to_lang)
+        for file_path, _ in entry['occurrences']:
+            if translated is None:
+                # Files with strings the cache could not translate are picked up again next run
+                pending.add(file_path)
+            else:
+                file_translations.setdefault(file_path, {})[cache_key] = translated
+    
+    # An output tree needs every file, translated or not
+    file_paths = [file_path for file_path in catalog.sources
+                  if (output_dir or file_path in file_translations) and file_path not in done]
+    output_paths = [os.path.join(output_dir, file_path) if output_dir else None for file_path in file_paths]
+    logger.info(f"Applying {to_lang} translations to {len(file_paths)} files"
+                f"{' in ' + output_dir if output_dir else ''}...")
+    results = run_in_processes(apply_file, file_paths, [file_translations.get(file_path, {}) for file_path in file_paths],
+                               [parser] * len(file_paths), output_paths, desc="Applying")
+    for file_path, timings, ok in results:
+        add_file_timings(file_path, timings)
+        if not ok:
+            # Failed writes stay pending so the next run and a --resume retry them
+            pending.add(file_path)
+        elif on_written:
+            on_written(file_path)
+    
+    if manifest is not None:
+        started = time.perf_counter()
+        for file_path, source_hash in catalog.sources.items():
+            if os.path.exists(file_path):
+                manifest.record(file_path, source_hash, file_path in pending)
+        if complete:
+            manifest.rules_version = RULES_VERSION
+        manifest.save()
+        metrics.add('manifest_seconds', time.perf_counter() - started)
+
+def source_words(text):
+    """Get the word content of a text, ignoring case, spacing and punctuation"""
+    return re.sub(r'[\W_]+', '', text.lower())
+
+def clear_and_rebuild_cache(to_lang=TARGET_LANG):
+    """Re-key and re-clean the cached translations under the current rules, without network"""
+    translation_cache = get_cache(to_lang)
+    logger.info(f"Rebuilding {SOURCE_LANG}-{to_lang} translation cache for rules version {RULES_VERSION}...")
+    rebuilt = {}
+    queued = []
+    kept = rekeyed = dropped = 0
+    for cache_key, translated in progress(translation_cache.items(), desc="Processing cache entries"):
+        if should_skip_translation(cache_key):
             # For skipped items that are identical in both languages, preserve them
-            if dutch_text == english_text:
-                translation_cache[dutch_text] = english_text
+            if cache_key == translated and cache_key not in rebuilt:
+                rebuilt[cache_key] = translated
+                kept += 1
+            else:
+                dropped += 1
+            continue
+        
+        text = clean_html_text(cache_key)
+        new_key = text.strip().lower()
+        if translated.strip().lower() == cache_key or new_key in rebuilt:
+            # Untranslated or duplicate under the new key
+            dropped += 1
+        elif source_words(new_key) != source_words(cache_key):
+            # The rules changed the words themselves, so the old translation no longer fits
+            queued.append(text)
+        else:
+            rebuilt[new_key] = clean_html_text(translated)
+            if new_key == cache_key:
+                kept += 1
+            else:
+                rekeyed += 1
+    translation_cache.replace(rebuilt)
+    translation_memories.pop(to_lang, None)  # Re-indexed from the rebuilt cache on next use
+    
+    engine = BatchTranslator(to_lang=to_lang)
+    for text in queued:
+        engine.collect(text)
+    engine.run()
     
     save_cache()
-    print(f"Cache rebuilt: {len(translation_cache)} entries")
+    logger.info(f"Cache rebuilt: {kept} kept, {rekeyed} re-keyed, {dropped} dropped, {len(queued)} queued for translation")
 
-def main():
+def main(argv=None):
     """Main function to run translations"""
-    global translation_cache
+    global translation_cache, backend, metrics, fuzzy_threshold, hedge_after
+    
+    parser = argparse.ArgumentParser(description="Translate the EA HTML export from Dutch to English")
+    parser.add_argument('--stage', choices=['all', 'extract', 'translate', 'apply'], default='all',
+                        help="run only one pipeline stage (translate and apply reuse the saved catalog)")
+    parser.add_argument('--force', action='store_true',
+                        help="rebuild the cache and reprocess every file, ignoring the manifest")
+    parser.add_argument('--backend', nargs='+', default=[DEFAULT_BACKEND],
+                        help="translators provider names in order of preference (bing google deepl ...), failing "
+                             "over between them, or the offline stand-in, e.g. 'local' or "
+                             "'local:latency=0.2,error_rate=0.01,throttle_rate=0.05'")
+    parser.add_argument('--hedge-after', type=float, default=HEDGE_AFTER,
+                        help="seconds after which a slow request is also sent to the next provider")
+    parser.add_argument('--parser', choices=['stream', 'html.parser', 'lxml'], default=HTML_PARSER,
+                        help="HTML rewriter: 'stream' only touches changed texts, the others re-serialize "
+                             "pages through BeautifulSoup (lxml is faster but optional)")
+    parser.add_argument('--fuzzy-threshold', type=float, default=FUZZY_THRESHOLD,
+                        help="similarity needed to reuse the translation of a near-identical string "
+                             "(above 1 only reuses strings differing in case, spacing or punctuation)")
+    parser.add_argument('--package',
+                        help="only translate this package subtree, given by title, TOC number (e.g. 0.2.2) or GUID")
+    parser.add_argument('--list-packages', action='store_true',
+                        help="list the packages with their TOC number and file count, then exit")
+    parser.add_argument('--languages', default=TARGET_LANG,
+                        help="comma-separated target languages, e.g. 'en,de'; each pair has its own cache")
+    parser.add_argument('--output',
+                        help="write one tree per language to OUTPUT/<language> instead of translating in place; "
+                             "unchanged pages are hard links and index.htm, toc.htm, css and images symlinks")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue the last interrupted run from its journal")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="DEBUG also logs every translated string")
+    parser.add_argument('--metrics', default=METRICS_FILE, help="JSON file for the per-phase metrics report")
+    parser.add_argument('--prometheus', help="also write the metrics to this Prometheus text file")
+    args = parser.parse_args(argv)
+    if args.parser == 'lxml' and not LXML_AVAILABLE:
+        parser.error("the lxml parser needs the lxml package (pip install lxml)")
+    if args.resume and args.stage != 'all':
+        parser.error("--resume continues a full run and cannot be combined with --stage")
+    if args.resume and args.package:
+        parser.error("--resume continues the files of the interrupted run and cannot be combined with --package")
+    languages = list(dict.fromkeys(language.strip() for language in args.languages.split(',') if language.strip()))
+    if not languages:
+        parser.error("--languages needs at least one target language")
+    if len(languages) > 1 and not args.output:
+        parser.error("translating into several languages needs --output")
+    if args.resume and args.output:
+        parser.error("--resume continues an in-place run; output trees are simply rebuilt from the cache")
+    
+    index = PackageIndex.load()
+    if args.list_packages:
+        for guid in index.walk():
+            node = index.nodes[guid]
+            if node['toc_file']:
+                print(f"{node['id']:<12} {len(index.files(guid)):>5} files  {node['title']}")
+        return
+    package = None
+    if args.package:
+        matches = index.find(args.package)
+        if not matches:
+            parser.error(f"no package {args.package!r} (see --list-packages)")
+        if len(matches) > 1:
+            numbers = ', '.join(index.nodes[guid]['id'] for guid in matches)
+            parser.error(f"package {args.package!r} is ambiguous, give its TOC number: {numbers}")
+        package = matches[0]
+    
+    logging.basicConfig(level=args.log_level, format='%(levelname)s %(message)s')
+    logger.setLevel(args.log_level)
+    backend = ProviderPool([create_backend(spec) for spec in args.backend])
+    hedge_after = args.hedge_after
+    metrics = Metrics()
+    fuzzy_threshold = args.fuzzy_threshold
+    
+    journal = RunJournal()
+    state = journal.load() if args.resume else None
     
     try:
-        load_cache()
+        with metrics.phase('setup'):
+            load_cache()
+            manifest = Manifest.load()
+            if state:
+                full_run = state['full_run']
+                file_paths = state['files']
+                journal.reopen()
+                logger.info(f"Resuming run: {len(state['extracted'])}/{len(file_paths)} files extracted, "
+                            f"{len(state['written'])} written, stages done: {sorted(state['stages']) or 'none'}")
+            else:
+                if args.resume:
+                    logger.info("No unfinished run to resume, starting a new one")
+                # The source export stays untouched with --output, so the manifest only applies in place
+                full_run = args.force or (not args.output and manifest.rules_version != RULES_VERSION)
+                # XML files first (they contain structure), then HTML files (they contain content), in TOC order
+                file_paths = index.files(package) if index.nodes else find_toc_files() + find_html_files()
+                if package:
+                    logger.info(f"Limited to package {index.nodes[package]['id']} {index.nodes[package]['title']}: "
+                                f"{len(file_paths)} files")
+                if args.output:
+                    manifest = None
+                elif not full_run:
+                    file_paths = manifest.changed_files(file_paths)
+                    logger.info(f"{len(file_paths)} new or changed files since the last run")
+                if args.stage == 'all' and not args.output:
+                    journal.start(file_paths, full_run)
+                    state = {'extracted': {}, 'stages': set(), 'written': set()}
+        
+        if args.stage in ('all', 'extract'):
+            if full_run and not (state and 'cache_rebuild' in state['stages']):
+                # Clear and rebuild cache with new rules
+                with metrics.phase('cache_rebuild'):
+                    for language in languages:
+                        clear_and_rebuild_cache(language)
+                if state:
+                    journal.record('stage', stage='cache_rebuild')
+            
+            with metrics.phase('extract'):
+                catalog = TranslationCatalog()
+                if state:
+                    # Files extracted before an interruption come straight from the journal
+                    for file_path, (source_hash, units) in state['extracted'].items():
+                        catalog.add_file(file_path, source_hash, units)
+                    file_paths = [file_path for file_path in file_paths if file_path not in state['extracted']]
+                catalog = extract_catalog(file_paths, args.parser, catalog, journal.extracted if state else None)
+                catalog.save()
+        else:
+            catalog = TranslationCatalog.load()
         
-        # Clear and rebuild cache with new rules
-        clear_and_rebuild_cache()
+        # Under new rules only a run over the whole export brings the manifest up to date
+        complete = not full_run or set(find_toc_files() + find_html_files()) <= set(catalog.sources)
         
-        # Translate XML files first (they contain structure)
-        translate_xml_files()
+        def apply(chunk, last=True):
+            """Write the cached translations of (part of) the catalog in place or into every output tree"""
+            with metrics.phase('apply'):
+                if args.output:
+                    for language in languages:
+                        apply_catalog(chunk, None, args.parser, to_lang=language,
+                                      output_dir=os.path.join(args.output, language))
+                else:
+                    apply_catalog(chunk, manifest, args.parser, state['written'] if state else (),
+                                  journal.written if state else None, complete and last, languages[0])
         
-        # Translate menu structure
-        translate_menu_xml()
+        applied = False
+        if args.stage in ('all', 'translate') and not (state and 'translate' in state['stages']):
+            with metrics.phase('translate'):
+                if args.stage == 'all':
+                    # Chunks are written as soon as they are translated, so the top of the TOC is done
+                    # first; the phase's wall time includes those writes
+                    translate_catalog(catalog, languages, APPLY_CHUNK_FILES, apply)
+                    applied = True
+                else:
+                    translate_catalog(catalog, languages)
+            if state:
+                journal.record('stage', stage='translate')
         
-        # Then translate HTML files (they contain content)
-        translate_html_files()
+        if args.stage in ('all', 'apply') and not applied:
+            apply(catalog)
+        if args.stage in ('all', 'apply') and args.output:
+            with metrics.phase('apply'):
+                for language in languages:
+                    link_shared_files(os.path.join(args.output, language))
+        
+        if state:
+            journal.finish()
         
         # Save final cache
         save_cache()
         
     except Exception as e:
-        print(f"Error in main: {e}")
+        logger.error(f"Error in main: {e}")
+    
+    metrics.write_json(args.metrics)
+    if args.prometheus:
+        metrics.write_prometheus(args.prometheus)
 
 if __name__ == '__main__':
     main()